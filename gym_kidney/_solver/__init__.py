@@ -3,3 +3,12 @@ from gym_kidney._solver.kidney_solver import *
 
 import gym_kidney._solver.kidney_digraph
 from gym_kidney._solver.kidney_digraph import *
+
+import gym_kidney._solver.kidney_cycles
+import gym_kidney._solver.kidney_cycle_index
+import gym_kidney._solver.kidney_incremental
+import gym_kidney._solver.kidney_cache
+import gym_kidney._solver.kidney_components
+import gym_kidney._solver.kidney_reduce
+import gym_kidney._solver.kidney_race
+import gym_kidney._solver.kidney_heuristic
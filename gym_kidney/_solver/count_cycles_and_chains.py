@@ -6,6 +6,8 @@ instance, up to given cycle and chain caps.
 import argparse
 import sys
 
+import numpy as np
+
 from gym_kidney._solver import kidney_digraph
 from gym_kidney._solver import kidney_ndds
 
@@ -53,27 +55,18 @@ def count_cycles(digraph, max_length):
     return st
 
 def count_chains(digraph, ndds, max_chain):
-    vtx_used = [False] * len(digraph.vs)
-    st = []
-    def find_chains_recurse(last_vtx, length, verts, st):
-        counts_by_size[length] += 1
-        st += [verts]
-        if length < max_chain:
-            for e in digraph.vs[last_vtx].edges:
-                if not vtx_used[e.tgt.id]:
-                    vtx_used[e.tgt.id] = True
-                    find_chains_recurse(e.tgt.id, length+1, verts + [e.tgt.id], st)
-                    vtx_used[e.tgt.id] = False
-    counts_by_size = [0] * (max_chain + 1)
-
-    if max_chain == 0:
-        return counts_by_size
-    for ndd_idx, ndd in enumerate(ndds):
-        for e in ndd.edges:
-            vtx_used[e.target_v.id] = True
-            find_chains_recurse(e.target_v.id, 1, [e.target_v.id], st)
-            vtx_used[e.target_v.id] = False
-    return st
+    """Count the chains of up to max_chain edges in the digraph.
+
+    Return value: a list whose element i is the number of chains with i
+    vertices. The chains are streamed in batches, so they are never all
+    held in memory.
+    """
+
+    counts_by_size = np.zeros(max_chain + 1, dtype=int)
+    for batch in kidney_ndds.ChainStream(digraph, ndds, max_chain):
+        lengths = np.count_nonzero(batch.vtx_indices >= 0, axis=1)
+        counts_by_size += np.bincount(lengths, minlength=max_chain + 1)
+    return counts_by_size.tolist()
 
 
 def start():
@@ -0,0 +1,176 @@
+"""Solving kidney-exchange instances exactly by branch and bound over cycles
+and chains, bounding each node with an LP relaxation rather than handing the
+whole problem to a MIP solver.
+"""
+
+import time
+
+import numpy as np
+
+from gym_kidney._solver import kidney_highs
+from gym_kidney._solver.kidney_digraph import *
+from gym_kidney._solver.kidney_ndds import *
+from gym_kidney._solver.kidney_ip import OptSolution
+from gym_kidney._solver.kidney_utils import EPS
+
+def element_ids(mask):
+    """Yield the indices of the bits set in mask."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time limit expires."""
+
+def lp_bound(options, cand, deadline, verbose):
+    """Solve the LP relaxation of packing the options with indices cand.
+
+    Returns:
+        (bound, x), the optimal LP value and the value of each candidate
+    """
+    builder = kidney_highs.MipBuilder()
+    elt_vars = {}
+    for k in cand:
+        var = builder.add_var(options[k][1])
+        for e in element_ids(options[k][0]):
+            elt_vars.setdefault(e, []).append((var, 1))
+    for coeffs in elt_vars.values():
+        builder.add_constr(coeffs, 1)
+
+    time_limit = None
+    if deadline is not None:
+        time_limit = deadline - time.time()
+        if time_limit <= 0:
+            raise SearchTimeout()
+    x = builder.solve(time_limit, verbose, relax=True)
+    if not builder.optimal:
+        raise SearchTimeout()
+    return float(np.dot(builder.obj, x)), x
+
+def round_down(options, cand, x):
+    """Pack the candidates greedily in decreasing order of their LP values,
+    returning (score, chosen option indices)."""
+    used, score, chosen = 0, 0.0, []
+    for i in np.argsort(-x, kind="stable").tolist():
+        if x[i] <= EPS:
+            break
+        mask, value = options[cand[i]][0], options[cand[i]][1]
+        if mask & used == 0:
+            used |= mask
+            score += value
+            chosen.append(cand[i])
+    return score, chosen
+
+def optimise_bnb(cfg):
+    """Optimise by branch and bound on the cycle formulation.
+
+    Each cycle or chain uses a set of elements: its vertices, and its NDD for a
+    chain. Each node of the search is bounded by the LP relaxation of packing
+    the cycles and chains still available to it, solved with HiGHS. An integral
+    LP solution closes the node; otherwise the LP solution is rounded down to a
+    packing to improve the incumbent, and the search branches on the most
+    fractional cycle or chain, first taking it and then leaving it out. A node
+    is pruned when its bound cannot beat the incumbent, or with a gap, cannot
+    beat it by more than the gap. The nodes wait on an explicit stack, so the
+    search depth is not limited by Python's recursion limit.
+
+    The gap reported is the one proven: that between the incumbent and the
+    largest bound of any node pruned by the gap or, if the time limit of cfg
+    expires, left open. A search that ends within the time limit is optimal
+    (within the gap of cfg).
+
+    Args:
+        cfg: an OptConfig object
+
+    Returns:
+        an OptSolution object
+    """
+
+    digraph, esp = cfg.digraph, cfg.edge_success_prob
+    cycles = cfg.find_cycles()
+
+    # (mask, score, is_cycle, cycle or chain) for each option worth taking
+    options = []
+    for c in cycles:
+        mask = 0
+        for v in c:
+            mask |= 1 << v.id
+        options.append((mask, failure_aware_cycle_score(c, digraph, esp), True, c))
+    for batch in cfg.chain_stream():
+        for i, (ndd_idx, row, score) in enumerate(zip(batch.ndd_index.tolist(),
+                                                      batch.vtx_indices.tolist(),
+                                                      batch.score.tolist())):
+            mask = 1 << (digraph.n + ndd_idx)
+            for v in row:
+                if v < 0:
+                    break
+                mask |= 1 << v
+            options.append((mask, score, False, (batch, i)))
+    options = [o for o in options if o[1] > EPS]
+
+    keep = 1.0 - cfg.gap
+    deadline = None if cfg.timelimit is None else time.time() + cfg.timelimit
+    best, best_chosen = 0.0, []
+    # the largest bound of a node pruned only thanks to the gap
+    pruned = 0.0
+    nodes = 0
+
+    # each node is (candidate option indices, chosen option indices, score,
+    # bound of its parent)
+    stack = [(list(range(len(options))), [], 0.0, float("inf"))]
+    try:
+        while stack:
+            cand, chosen, score, bound = stack[-1]
+            if keep * bound <= best + EPS:
+                stack.pop()
+                pruned = max(pruned, bound)
+                continue
+            if not cand:
+                stack.pop()
+                if score > best + EPS:
+                    best, best_chosen = score, chosen
+                continue
+
+            lp, x = lp_bound(options, cand, deadline, cfg.verbose)
+            nodes += 1
+            stack.pop()
+            bound = score + lp
+            if keep * bound <= best + EPS:
+                pruned = max(pruned, bound)
+                continue
+
+            rounded, extra = round_down(options, cand, x)
+            if score + rounded > best + EPS:
+                best, best_chosen = score + rounded, chosen + extra
+            frac = np.abs(x - 0.5)
+            i = int(np.argmin(frac))
+            if frac[i] >= 0.5 - EPS:
+                # integral, so the rounding is the LP optimum
+                continue
+
+            k = cand[i]
+            mask = options[k][0]
+            stack.append((cand[:i] + cand[i + 1:], chosen, score, bound))
+            stack.append(([j for j in cand if options[j][0] & mask == 0],
+                          chosen + [k], score + options[k][1], bound))
+        optimal = True
+    except SearchTimeout:
+        optimal = False
+        pruned = max([pruned] + [node[3] for node in stack])
+
+    # a node left open before its LP was solved has no finite bound
+    upper = max(pruned, best)
+    if upper == float("inf"):
+        gap = 1
+    else:
+        gap = (upper - best) / upper if upper - best > EPS else 0
+    chosen = [options[k] for k in best_chosen]
+    return OptSolution(ip_model=None,
+                       cycles=[o[3] for o in chosen if o[2]],
+                       chains=[o[3][0].chain(o[3][1]) for o in chosen if not o[2]],
+                       digraph=digraph,
+                       edge_success_prob=esp,
+                       optimal=optimal,
+                       gap=gap,
+                       nodes=nodes)
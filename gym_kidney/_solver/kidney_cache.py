@@ -0,0 +1,185 @@
+"""Caching optimal solutions of kidney-exchange instances.
+
+An instance is identified by a fingerprint of a canonical form, in which the
+vertices are ordered by colours refined from the weights of their edges, so
+instances that differ only by a permutation of vertices usually share a
+fingerprint. Ties between vertices of the same colour are broken by id, so
+equal fingerprints always mean equal canonical forms, but some isomorphic
+instances get different fingerprints.
+"""
+
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+import numpy as np
+
+from gym_kidney._solver.kidney_ip import OptSolution
+from gym_kidney._solver.kidney_ndds import Chain
+
+# The number of rounds of colour refinement
+ROUNDS = 3
+
+def mix(x):
+    """Scramble the bits of an array of uint64 (the splitmix64 finaliser)."""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xbf58476d1ce4e5b9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+def refine_colours(n, src, tgt, weight, colour):
+    """Refine vertex colours of a weighted digraph by the multisets of
+    (colour, weight) of the out- and in-neighbours of each vertex.
+
+    Returns:
+        an array of n uint64 colours
+    """
+
+    wbits = mix(np.asarray(weight, dtype=np.float64).view(np.uint64))
+    colour = mix(np.asarray(colour, dtype=np.uint64) + np.uint64(1))
+    for __ in range(ROUNDS):
+        out = np.zeros(n, dtype=np.uint64)
+        into = np.zeros(n, dtype=np.uint64)
+        np.add.at(out, src, mix(colour[tgt] ^ wbits))
+        np.add.at(into, tgt, mix(colour[src] + wbits))
+        colour = mix(colour ^ mix(out) ^ (mix(into) * np.uint64(3)))
+    return colour
+
+def fingerprint(cfg):
+    """Find the canonical form of the instance of an OptConfig.
+
+    Returns:
+        (key, dd_order, ndd_order), where key is a hex string identifying the
+        canonical form, and dd_order[i] and ndd_order[i] are the ids of the
+        vertex and the NDD at canonical position i
+    """
+
+    digraph, ndds = cfg.digraph, cfg.ndds
+    n, k = digraph.n, len(ndds)
+    src = np.array([e.src.id for e in digraph.es] +
+                   [n + i for i, ndd in enumerate(ndds) for e in ndd.edges], dtype=np.int64)
+    tgt = np.array([e.tgt.id for e in digraph.es] +
+                   [e.target_v.id for ndd in ndds for e in ndd.edges], dtype=np.int64)
+    weight = np.array([e.score for e in digraph.es] +
+                      [e.score for ndd in ndds for e in ndd.edges], dtype=np.float64)
+
+    is_ndd = np.arange(n + k) >= n
+    colour = refine_colours(n + k, src, tgt, weight, is_ndd)
+    order = np.lexsort((np.arange(n + k), colour, is_ndd))
+    rank = np.empty(n + k, dtype=np.int64)
+    rank[order] = np.arange(n + k)
+
+    edges = np.lexsort((rank[tgt], rank[src]))
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((n, k, cfg.max_cycle, cfg.max_chain, cfg.edge_success_prob,
+                   cfg.chain_limit, cfg.gap)).encode())
+    h.update(rank[src][edges].tobytes())
+    h.update(rank[tgt][edges].tobytes())
+    h.update(weight[edges].tobytes())
+    return h.hexdigest(), order[:n], order[n:] - n
+
+def encode_solution(opt, dd_order, ndd_order):
+    """Write the cycles and chains of an OptSolution in canonical positions."""
+    dd_rank = np.argsort(dd_order).tolist()
+    ndd_rank = np.argsort(ndd_order).tolist()
+    cycles = tuple(tuple(dd_rank[v.id] for v in c) for c in opt.cycles)
+    chains = tuple((ndd_rank[c.ndd_index], tuple(dd_rank[v] for v in c.vtx_indices), c.score)
+                   for c in opt.chains)
+    return cycles, chains
+
+def decode_solution(entry, cfg, dd_order, ndd_order):
+    """Build the OptSolution for cfg from cycles and chains in canonical positions."""
+    cycles, chains = entry
+    dd_order, ndd_order = dd_order.tolist(), ndd_order.tolist()
+    vs = cfg.digraph.vs
+    return OptSolution(ip_model=None,
+                       cycles=[[vs[dd_order[i]] for i in c] for c in cycles],
+                       chains=[Chain(ndd_order[ndd], [dd_order[i] for i in c], score)
+                               for ndd, c, score in chains],
+                       digraph=cfg.digraph,
+                       edge_success_prob=cfg.edge_success_prob)
+
+class SolutionCache(object):
+    """A least-recently-used cache of optimal solutions by fingerprint, with an
+    optional on-disk tier that outlives the process. It can be shared by threads.
+
+    Data members:
+        max_entries: the most solutions held in memory
+        path: the directory of the on-disk tier, or None
+        hits: the number of lookups that found a solution
+        misses: the number of lookups that did not
+        disk_hits: the number of hits read from the on-disk tier
+    """
+
+    def __init__(self, max_entries=1024, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the entry for key, or None if there is none."""
+        with self.lock:
+            return self._get(key)
+
+    def put(self, key, entry):
+        """Store the entry for key, in memory and on disk."""
+        with self.lock:
+            self._put(key, entry)
+
+    def clear(self):
+        """Drop the entries held in memory."""
+        with self.lock:
+            self.entries.clear()
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        elif self.path is not None:
+            entry = self._read(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(key, entry)
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def _put(self, key, entry):
+        self._remember(key, entry)
+        if self.path is not None:
+            fd, tmp = tempfile.mkstemp(dir=self.path)
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(entry, f)
+            os.replace(tmp, self._file(key))
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + ".pickle")
+
+    def _read(self, key):
+        try:
+            with open(self._file(key), "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
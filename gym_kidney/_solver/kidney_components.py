@@ -0,0 +1,146 @@
+"""Splitting a kidney-exchange instance into parts that can be solved
+independently.
+
+An edge between two strongly connected components is in no cycle, so it can
+only be used by a chain, and only if its source is within max_chain - 1 edges
+of an NDD. The parts are the weakly connected components of the vertices and
+NDDs joined by the edges that can be used. A part without such an edge admits
+no cycle or chain and is skipped.
+"""
+
+import concurrent.futures
+import copy
+
+import numpy as np
+import scipy.sparse
+from scipy.sparse import csgraph
+
+from gym_kidney._solver.kidney_ip import OptSolution
+from gym_kidney._solver.kidney_ndds import Chain, create_relabelled_ndds
+
+def chain_sources(n, src, tgt, ndd_tgt, max_chain):
+    """Find the vertices whose out-edges can be used by a chain of at most
+    max_chain edges, given the targets of the edges from NDDs."""
+
+    reach = np.zeros(n, dtype=bool)
+    if max_chain < 2:
+        return reach
+    adj = scipy.sparse.csr_matrix((np.ones(len(src)), (tgt, src)), shape=(n, n))
+    reach[ndd_tgt] = True
+    frontier = reach
+    for __ in range(max_chain - 2):
+        frontier = (adj @ frontier > 0) & ~reach
+        if not frontier.any():
+            break
+        reach = reach | frontier
+    return reach
+
+def components(cfg):
+    """Split the instance of an OptConfig into parts.
+
+    Returns:
+        a list with a pair (vtx_ids, ndd_ids) of sorted arrays for each part
+    """
+
+    digraph, ndds = cfg.digraph, cfg.ndds
+    n, k = digraph.n, len(ndds)
+    src = np.array([e.src.id for e in digraph.es], dtype=int)
+    tgt = np.array([e.tgt.id for e in digraph.es], dtype=int)
+    if cfg.max_chain > 0:
+        ndd_src = np.array([i for i, ndd in enumerate(ndds) for e in ndd.edges], dtype=int)
+        ndd_tgt = np.array([e.target_v.id for ndd in ndds for e in ndd.edges], dtype=int)
+    else:
+        ndd_src = ndd_tgt = np.zeros(0, dtype=int)
+
+    useful = np.zeros(len(src), dtype=bool)
+    if cfg.max_cycle >= 2 and len(src) > 0:
+        adj = scipy.sparse.csr_matrix((np.ones(len(src)), (src, tgt)), shape=(n, n))
+        __, scc = csgraph.connected_components(adj, connection="strong")
+        useful = scc[src] == scc[tgt]
+    useful |= chain_sources(n, src, tgt, ndd_tgt, cfg.max_chain)[src]
+
+    # NDD i is node n + i
+    a = np.concatenate([src[useful], n + ndd_src])
+    b = np.concatenate([tgt[useful], ndd_tgt])
+    adj = scipy.sparse.csr_matrix((np.ones(len(a)), (a, b)), shape=(n + k, n + k))
+    n_parts, part = csgraph.connected_components(adj, connection="weak")
+
+    order = np.argsort(part, kind="stable")
+    bounds = np.searchsorted(part[order], np.arange(n_parts + 1))
+    parts = []
+    for p in np.unique(part[a]).tolist():
+        members = order[bounds[p]:bounds[p + 1]]
+        parts.append((members[members < n], members[members >= n] - n))
+    return parts
+
+def part_config(cfg, vtx_ids, ndd_ids, cycles=None):
+    """Return a copy of an OptConfig restricted to one part, whose vertex i and
+    NDD i are vertex vtx_ids[i] and NDD ndd_ids[i] of the instance, given the
+    cycles of cfg in the part if cfg has cycles."""
+
+    part = copy.copy(cfg)
+    vertices = [cfg.digraph.vs[i] for i in vtx_ids.tolist()]
+    part.digraph = cfg.digraph.induced_subgraph(vertices)
+    old_to_new_vtx = {v.id: part.digraph.vs[i] for i, v in enumerate(vertices)}
+    part.ndds = create_relabelled_ndds([cfg.ndds[i] for i in ndd_ids.tolist()],
+                                       old_to_new_vtx)
+    if cfg.cycles is not None:
+        part.cycles = [[old_to_new_vtx[v.id] for v in c] for c in cycles]
+    return part
+
+def solve_components(cfg, solve, workers=1):
+    """Solve each part of the instance of an OptConfig on its own and join the
+    solutions.
+
+    Args:
+        cfg: an OptConfig object
+        solve: a function from an OptConfig to an OptSolution
+        workers: the number of parts solved at once, in threads; Gurobi
+            models built on a worker thread use that thread's own environment
+
+    Returns:
+        an OptSolution object
+    """
+
+    parts = components(cfg)
+
+    part_cycles = [[] for __ in parts]
+    if cfg.cycles is not None:
+        vtx_part = np.full(cfg.digraph.n, -1, dtype=int)
+        for p, (vtx_ids, __) in enumerate(parts):
+            vtx_part[vtx_ids] = p
+        for c in cfg.cycles:
+            p = vtx_part[c[0].id]
+            if p >= 0:
+                part_cycles[p].append(c)
+
+    cfgs = [part_config(cfg, vtx_ids, ndd_ids, cycles)
+            for (vtx_ids, ndd_ids), cycles in zip(parts, part_cycles)]
+    if workers > 1 and len(cfgs) > 1:
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            solutions = list(executor.map(solve, cfgs))
+    else:
+        solutions = [solve(c) for c in cfgs]
+
+    return join_solutions(cfg, parts, solutions)
+
+def join_solutions(cfg, parts, solutions):
+    """Join the solutions of parts of the instance of an OptConfig, given by
+    pairs (vtx_ids, ndd_ids) as from components, into an OptSolution."""
+
+    vs = cfg.digraph.vs
+    cycles, chains = [], []
+    for (vtx_ids, ndd_ids), opt in zip(parts, solutions):
+        vtx_ids, ndd_ids = vtx_ids.tolist(), ndd_ids.tolist()
+        cycles += [[vs[vtx_ids[v.id]] for v in c] for c in opt.cycles]
+        chains += [Chain(ndd_ids[c.ndd_index], [vtx_ids[i] for i in c.vtx_indices], c.score)
+                   for c in opt.chains]
+
+    return OptSolution(ip_model=None,
+                       cycles=cycles,
+                       chains=chains,
+                       digraph=cfg.digraph,
+                       edge_success_prob=cfg.edge_success_prob,
+                       optimal=all(opt.optimal for opt in solutions),
+                       gap=max([opt.gap for opt in solutions], default=0),
+                       nodes=sum(opt.nodes for opt in solutions))
@@ -0,0 +1,176 @@
+"""An index of the short cycles of a pool that changes a little between updates.
+
+Vertices are identified by uids that are never reused. An update diffs the
+pool against the previous one, drops the cycles through vertices that left or
+whose edges changed, and enumerates only the cycles through those vertices.
+"""
+
+import numpy as np
+
+from gym_kidney._solver.kidney_cycles import packed_cycles
+
+def edge_keys(uid_src, uid_tgt):
+    """Pack the uids of the endpoints of each edge into one integer."""
+    return (uid_src.astype(np.int64) << 32) | uid_tgt.astype(np.int64)
+
+def csr_lists(n, src, tgt, weight=None):
+    """Group edges by source, returning (targets, indptr, weights)."""
+    order = np.argsort(src, kind="stable")
+    indptr = np.searchsorted(src[order], np.arange(n + 1))
+    return tgt[order], indptr, None if weight is None else weight[order]
+
+def cycles_through(s, max_length, succ, pred, blocked):
+    """Find each cycle through vertex s of at most max_length vertices avoiding
+    the blocked vertices.
+
+    Args:
+        succ, pred: successor and predecessor lists from csr_lists
+
+    Returns:
+        a list of cycles, each a list of vertices starting with s
+    """
+
+    # dist_back[v] is the number of edges on a shortest path from v to s
+    dist_back = {s: 0}
+    frontier = [s]
+    for d in range(1, max_length):
+        next_frontier = []
+        for v in frontier:
+            for u in pred[0][pred[1][v]:pred[1][v+1]].tolist():
+                if u not in dist_back and not blocked[u]:
+                    dist_back[u] = d
+                    next_frontier.append(u)
+        frontier = next_frontier
+
+    cycles = []
+    path = [s]
+
+    def extend(v):
+        for w in succ[0][succ[1][v]:succ[1][v+1]].tolist():
+            if w == s:
+                cycles.append(path[:])
+            elif w in dist_back and len(path) + dist_back[w] <= max_length and w not in path:
+                path.append(w)
+                extend(w)
+                del path[-1]
+
+    extend(s)
+    return cycles
+
+class CycleIndex(object):
+    """The cycles of at most max_cycle vertices of an evolving pool.
+
+    Each cycle is a tuple of uids rotated to start at the smallest.
+
+    Data members:
+        max_cycle
+        cycles: the set of cycles
+        vtx_cycles: a dict from each uid to the set of cycles through it
+        counts: counts[k] is the number of cycles of k vertices
+        uids: the sorted uids of the pool as of the last update
+        keys: the sorted edge keys of the pool as of the last update
+    """
+
+    def __init__(self, max_cycle):
+        self.max_cycle = max_cycle
+        self.cycles = set()
+        self.vtx_cycles = {}
+        self.counts = np.zeros(max_cycle + 1, dtype=int)
+        self.uids = np.zeros(0, dtype=np.int64)
+        self.keys = np.zeros(0, dtype=np.int64)
+
+    def update(self, uid, ndd, src, tgt):
+        """Update the index to the pool.
+
+        Args:
+            uid: the uid of the vertex in each slot
+            ndd: whether the vertex in each slot is an NDD
+            src, tgt: the edges, by slot
+
+        Returns:
+            (removed, added), the lists of cycles that left and joined the index
+        """
+
+        n = len(uid)
+        uid = np.asarray(uid, dtype=np.int64)
+        ndd = np.asarray(ndd, dtype=bool)
+        src, tgt = np.asarray(src, dtype=int), np.asarray(tgt, dtype=int)
+        pair = ~ndd[src] & ~ndd[tgt]
+        src, tgt = src[pair], tgt[pair]
+        keys = np.sort(edge_keys(uid[src], uid[tgt]))
+
+        dead = np.setdiff1d(self.uids, uid, assume_unique=True)
+        gone = np.setdiff1d(self.keys, keys, assume_unique=True)
+        added = np.setdiff1d(keys, self.keys, assume_unique=True)
+        changed = np.concatenate([gone, added])
+
+        dirty = ~np.isin(uid, self.uids, assume_unique=True)
+        dirty |= np.isin(uid, np.concatenate([changed >> 32, changed & 0xffffffff]))
+        dirty &= ~ndd
+
+        removed = set()
+        for u in np.concatenate([dead, uid[dirty]]).tolist():
+            removed.update(self.vtx_cycles.get(u, ()))
+        for c in removed:
+            self.remove(c)
+
+        if self.max_cycle < 2:
+            found = []
+        elif dirty[~ndd].all():
+            # every pair is new or changed, so find all cycles at once
+            found = [row[row >= 0] for row in packed_cycles(n, src, tgt, self.max_cycle)]
+        else:
+            succ = csr_lists(n, src, tgt)
+            pred = csr_lists(n, tgt, src)
+            blocked = np.zeros(n, dtype=bool)
+            found = []
+            for s in np.flatnonzero(dirty).tolist():
+                found += cycles_through(s, self.max_cycle, succ, pred, blocked)
+                blocked[s] = True
+
+        new = []
+        for cycle in found:
+            uids = uid[cycle].tolist()
+            i = uids.index(min(uids))
+            c = tuple(uids[i:] + uids[:i])
+            self.add(c)
+            new.append(c)
+
+        for u in dead.tolist():
+            self.vtx_cycles.pop(u, None)
+        self.uids = np.sort(uid)
+        self.keys = keys
+
+        # a cycle can leave and come back when only some of its vertices changed
+        back = removed.intersection(new)
+        return ([c for c in removed if c not in back],
+                [c for c in new if c not in back])
+
+    def add(self, c):
+        """Add a cycle to the index."""
+        self.cycles.add(c)
+        self.counts[len(c)] += 1
+        for u in c:
+            self.vtx_cycles.setdefault(u, set()).add(c)
+
+    def remove(self, c):
+        """Remove a cycle from the index."""
+        self.cycles.discard(c)
+        self.counts[len(c)] -= 1
+        for u in c:
+            cs = self.vtx_cycles.get(u)
+            if cs is not None:
+                cs.discard(c)
+                if not cs:
+                    del self.vtx_cycles[u]
+
+    def cycles_through(self, u):
+        """The set of cycles through the vertex with uid u."""
+        return self.vtx_cycles.get(u, set())
+
+    def slot_cycles(self, uid):
+        """The cycles as arrays of slots, given the uid of the vertex in each slot."""
+        uid = np.asarray(uid, dtype=np.int64)
+        order = np.argsort(uid)
+        sorted_uid = uid[order]
+        return [order[np.searchsorted(sorted_uid, c)] for c in self.cycles]
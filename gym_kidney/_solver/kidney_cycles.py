@@ -0,0 +1,133 @@
+"""Finding the short cycles of a digraph with array operations.
+
+Cycles are packed into an array with one row per cycle. Each row starts at the
+lowest vertex of its cycle and is padded with -1, and rows are in lexicographic
+order with the padding sorting first, which is the order in which
+Digraph.generate_cycles yields them when out-edges are in order of target.
+"""
+
+import numpy as np
+
+# The number of paths extended at a time, which bounds memory use
+CHUNK = 1 << 18
+
+class EdgeSet(object):
+    """The edges of a digraph with n vertices in CSR form, with sorted keys
+    src * n + tgt for membership tests."""
+
+    def __init__(self, n, src, tgt):
+        src = np.asarray(src, dtype=np.int64)
+        tgt = np.asarray(tgt, dtype=np.int64)
+        order = np.lexsort((tgt, src))
+        self.n = n
+        self.src = src[order]
+        self.tgt = tgt[order]
+        self.indptr = np.searchsorted(self.src, np.arange(n + 1))
+        self.keys = self.src * n + self.tgt
+
+    def has_edges(self, src, tgt):
+        """Whether each edge src[i] -> tgt[i] is in the set."""
+        q = src * self.n + tgt
+        i = np.minimum(np.searchsorted(self.keys, q), max(len(self.keys) - 1, 0))
+        return self.keys[i] == q if len(self.keys) > 0 else np.zeros(len(q), dtype=bool)
+
+    def extend(self, paths):
+        """Extend each path by each out-edge of its last vertex to a vertex
+        greater than its first that it does not visit yet."""
+
+        last = paths[:, -1]
+        counts = self.indptr[last + 1] - self.indptr[last]
+        rows = np.repeat(np.arange(len(paths)), counts)
+        offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        nxt = self.tgt[np.repeat(self.indptr[last], counts) + offsets]
+
+        paths = paths[rows]
+        keep = nxt > paths[:, 0]
+        for j in range(1, paths.shape[1] - 1):
+            keep &= nxt != paths[:, j]
+        return np.column_stack([paths[keep], nxt[keep]])
+
+def paths_by_length(es, max_length):
+    """Find the simple paths of es starting at their lowest vertex.
+
+    Returns:
+        a dict from each number of vertices k, 2 <= k <= max_length, to an
+        array with one row per path of k vertices
+    """
+
+    paths = {2: np.column_stack([es.src, es.tgt])[es.src < es.tgt]}
+    for k in range(2, max_length):
+        prev = paths[k]
+        paths[k + 1] = np.concatenate(
+                [es.extend(prev[i:i + CHUNK]) for i in range(0, len(prev), CHUNK)]
+                + [np.zeros((0, k + 1), dtype=np.int64)])
+    return paths
+
+def join_paths(left, right, n):
+    """Join forward paths u -> ... -> w with backward paths u <- ... <- w that
+    share no inner vertex into cycles u -> ... -> w -> ... -> u."""
+
+    rkeys = right[:, 0] * n + right[:, -1]
+    order = np.argsort(rkeys, kind="stable")
+    right, rkeys = right[order], rkeys[order]
+
+    cycles = [np.zeros((0, left.shape[1] + right.shape[1] - 2), dtype=np.int64)]
+    for i in range(0, len(left), CHUNK):
+        chunk = left[i:i + CHUNK]
+        lkeys = chunk[:, 0] * n + chunk[:, -1]
+        lo = np.searchsorted(rkeys, lkeys, "left")
+        counts = np.searchsorted(rkeys, lkeys, "right") - lo
+        rows = np.repeat(np.arange(len(chunk)), counts)
+        offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        L, R = chunk[rows], right[np.repeat(lo, counts) + offsets]
+
+        keep = np.ones(len(rows), dtype=bool)
+        for j in range(1, L.shape[1] - 1):
+            for k in range(1, R.shape[1] - 1):
+                keep &= L[:, j] != R[:, k]
+        cycles.append(np.column_stack([L[keep], R[keep, -2:0:-1]]))
+
+    return np.concatenate(cycles)
+
+def packed_cycles(n, src, tgt, max_length):
+    """Find the cycles of at most max_length vertices of a digraph.
+
+    Cycles of two and three vertices close a path with one edge. Longer cycles
+    join a forward path from their lowest vertex with a backward path into it,
+    so no path has more than about half the vertices of a cycle.
+
+    Args:
+        n: the number of vertices
+        src, tgt: the source and target of each edge (without self-loops)
+        max_length: the maximum number of vertices in a cycle
+
+    Returns:
+        an array with one row of max_length vertex ids per cycle, as described
+        in the module docstring
+    """
+
+    width = max(max_length, 0)
+    if max_length < 2 or len(src) == 0:
+        return np.full((0, width), -1, dtype=np.int64)
+
+    fwd = EdgeSet(n, src, tgt)
+    forward = paths_by_length(fwd, (max_length + 3) // 2)
+    if max_length >= 4:
+        backward = paths_by_length(EdgeSet(n, tgt, src), (max_length + 2) // 2)
+
+    found = []
+    for k in range(2, max_length + 1):
+        if k <= 3:
+            paths = forward[k]
+            cycles = paths[fwd.has_edges(paths[:, -1], paths[:, 0])]
+        else:
+            a = (k + 3) // 2
+            cycles = join_paths(forward[a], backward[k + 2 - a], n)
+        found.append(np.pad(cycles, ((0, 0), (0, width - k)), constant_values=-1))
+
+    cycles = np.concatenate(found)
+    return cycles[np.lexsort(cycles.T[::-1])]
+
+def cycle_lengths(cycles):
+    """The number of vertices of each packed cycle."""
+    return np.count_nonzero(cycles >= 0, axis=1)
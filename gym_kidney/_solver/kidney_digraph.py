@@ -5,6 +5,8 @@ some related methods.
 
 from collections import deque
 
+from gym_kidney._solver.kidney_cycles import packed_cycles
+
 class KidneyReadException(Exception):
     pass
 
@@ -32,7 +34,12 @@ def failure_aware_cycle_score(cycle, digraph, edge_success_prob):
                     for i in range(len(cycle))) * edge_success_prob**len(cycle)
 
 class Vertex:
-    """A vertex in a directed graph (see the Digraph class)."""
+    """A vertex in a directed graph (see the Digraph class).
+
+    The grb_* slots hold Gurobi variables while a formulation is built.
+    """
+
+    __slots__ = ["id", "edges", "grb_vars_in", "grb_vars_out"]
 
     def __init__(self, id):
         self.id = id
@@ -42,7 +49,12 @@ class Vertex:
         return ("V{}".format(self.id))
 
 class Edge:
-    """An edge in a directed graph (see the Digraph class)."""
+    """An edge in a directed graph (see the Digraph class).
+
+    The grb_* slots hold Gurobi variables while a formulation is built.
+    """
+
+    __slots__ = ["id", "score", "src", "tgt", "grb_vars", "grb_var_positions"]
 
     def __init__(self, id, score, src, tgt):
         self.id = id
@@ -53,6 +65,15 @@ class Edge:
     def __str__(self):
         return ("V" + str(self.src.id) + "-V" + str(self.tgt.id))
 
+class EdgeRow(dict):
+    """The out-edges of a vertex, keyed by target id. Looking up a missing
+    target gives None, as in a row of an adjacency matrix."""
+
+    __slots__ = []
+
+    def __missing__(self, tgt_id):
+        return None
+
 class Digraph:
     """A directed graph, in which each edge has a numeric score.
 
@@ -60,13 +81,15 @@ class Digraph:
         n: the number of vertices in the digraph
         vs: an array of Vertex objects, such that vs[i].id == i
         es: an array of Edge objects, such that es[i].id = i
+        adj_mat: an array of EdgeRow objects, such that adj_mat[i][j] is the
+            Edge from vertex i to vertex j, or None if there is no such edge
     """
 
     def __init__(self, n):
         """Create a Digraph with n vertices"""
         self.n = n
         self.vs = [Vertex(i) for i in range(n)]
-        self.adj_mat = [[None for x in range(n)] for x in range(n)]
+        self.adj_mat = [EdgeRow() for x in range(n)]
         self.es = []
 
     def add_edge(self, score, source, tgt):
@@ -92,7 +115,16 @@ class Digraph:
             vertices, with the first vertex _not_ repeated at the end.
         """
         
-        return [cycle for cycle in self.generate_cycles(max_length)]
+        vs = self.vs
+        return [[vs[i] for i in row if i >= 0]
+                for row in self.find_packed_cycles(max_length).tolist()]
+
+    def find_packed_cycles(self, max_length):
+        """Find cycles of length up to max_length in the digraph, packed into an
+        array of vertex ids as described in kidney_cycles."""
+
+        return packed_cycles(self.n, [e.src.id for e in self.es],
+                             [e.tgt.id for e in self.es], max_length)
 
     def generate_cycles(self, max_length):
         """Generate cycles of length up to max_length in the digraph.
@@ -146,11 +178,15 @@ class Digraph:
             path to low_vtx from v is shorter than max_path, then element v of the array
             will be the length of this shortest path. Otherwise, element v will be
             999999999."""
+        # in-neighbour lists, each in increasing order of id
+        transp_adj_lists = [[] for v in self.vs]
+        for v in self.vs[low_vtx:]:
+            for edge in v.edges:
+                transp_adj_lists[edge.tgt.id].append(v)
+
         def adj_list_accessor(v):
-            for i in range(low_vtx, len(self.vs)):
-                if self.adj_mat[i][v.id]:
-                    yield self.vs[i]
-            
+            return transp_adj_lists[v.id]
+
         return self.calculate_shortest_path_lengths(self.vs[low_vtx], max_path,
                     adj_list_accessor=adj_list_accessor)
 
@@ -190,24 +226,39 @@ class Digraph:
     def edge_exists(self, v1, v2):
         """Returns true if and only if an edge exists from Vertex v1 to Vertex v2."""
 
-        return self.adj_mat[v1.id][v2.id] is not None
+        return v2.id in self.adj_mat[v1.id]
                     
     def induced_subgraph(self, vertices):
-        """Returns the subgraph indiced by a given list of vertices."""
+        """Returns the subgraph indiced by a given list of vertices.
+
+        Edges are added in the order of their source, then target, in vertices.
+        """
 
+        new_ids = {v.id: i for i, v in enumerate(vertices)}
         subgraph = Digraph(len(vertices))
         for i, v in enumerate(vertices):
-            for j, w in enumerate(vertices):
-                e = self.adj_mat[v.id][w.id]
-                if e is not None:
-                    new_src = subgraph.vs[i]
-                    new_tgt = subgraph.vs[j]
-                    subgraph.add_edge(e.score, new_src, new_tgt)
+            out = [(new_ids[e.tgt.id], e) for e in v.edges if e.tgt.id in new_ids]
+            out.sort(key=lambda je: je[0])
+            for j, e in out:
+                subgraph.add_edge(e.score, subgraph.vs[i], subgraph.vs[j])
         return subgraph
 
     def __str__(self):
         return "\n".join([str(v) for v in self.vs])
         
+def digraph_from_arrays(n, src, tgt, score):
+    """Builds a digraph with n vertices from sequences of the source id, target
+    id and score of each edge, without checking them."""
+
+    digraph = Digraph(n)
+    vs, es, adj_mat = digraph.vs, digraph.es, digraph.adj_mat
+    for id, (src_id, tgt_id, w) in enumerate(zip(src, tgt, score)):
+        e = Edge(id, w, vs[src_id], vs[tgt_id])
+        es.append(e)
+        vs[src_id].edges.append(e)
+        adj_mat[src_id][tgt_id] = e
+    return digraph
+
 def read_digraph(lines):
     """Reads a digraph from an array of strings in the input format."""
 
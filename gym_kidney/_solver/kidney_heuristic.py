@@ -0,0 +1,213 @@
+"""Finding good but not necessarily optimal solutions quickly.
+
+The cycles and chains of an instance are options, each using a set of
+elements: its vertices, and its NDD for a chain. A solution is a set of
+options using disjoint elements. Greedy packing takes options in order of
+score, LP rounding takes them in order of their value in the LP relaxation of
+the cycle formulation, and local search then exchanges options while that
+increases the score. With a time limit, local search stops when it expires
+and the packing found so far is returned.
+"""
+
+import time
+
+import numpy as np
+
+from gym_kidney._solver.kidney_digraph import failure_aware_cycle_score
+from gym_kidney._solver.kidney_highs import MipBuilder
+from gym_kidney._solver.kidney_ip import OptSolution
+from gym_kidney._solver.kidney_utils import EPS
+
+class Options(object):
+    """The cycles and chains of an instance.
+
+    Data members:
+        n_elts: the number of elements, where vertex v is element v.id and
+            NDD i is element n + i
+        elements: the list of elements of each option
+        score: an array of the score of each option
+        payload: the cycle (a list of vertices) or chain, as a pair (batch,
+            row), of each option
+        is_cycle: whether each option is a cycle
+    """
+
+    def __init__(self, cfg):
+        digraph, esp = cfg.digraph, cfg.edge_success_prob
+        n = digraph.n
+        self.n_elts = n + len(cfg.ndds)
+        self.elements = []
+        self.payload = []
+        self.is_cycle = []
+        score = []
+
+        for c in cfg.find_cycles():
+            self.elements.append([v.id for v in c])
+            self.payload.append(c)
+            self.is_cycle.append(True)
+            score.append(failure_aware_cycle_score(c, digraph, esp))
+
+        for batch in cfg.chain_stream():
+            for i, (ndd_idx, row) in enumerate(zip(batch.ndd_index.tolist(),
+                                                   batch.vtx_indices.tolist())):
+                self.elements.append([n + ndd_idx] + [v for v in row if v >= 0])
+                self.payload.append((batch, i))
+                self.is_cycle.append(False)
+            score += batch.score.tolist()
+
+        self.score = np.array(score, dtype=float)
+
+    def __len__(self):
+        return len(self.elements)
+
+    def element_options(self):
+        """Return a list of the options using each element."""
+        elt_options = [[] for __ in range(self.n_elts)]
+        for i, elts in enumerate(self.elements):
+            for e in elts:
+                elt_options[e].append(i)
+        return elt_options
+
+    def solution(self, cfg, chosen):
+        """Return an OptSolution with the chosen options."""
+        chosen = sorted(chosen)
+        return OptSolution(ip_model=None,
+                           cycles=[self.payload[i] for i in chosen if self.is_cycle[i]],
+                           chains=[self.payload[i][0].chain(self.payload[i][1])
+                                   for i in chosen if not self.is_cycle[i]],
+                           digraph=cfg.digraph,
+                           edge_success_prob=cfg.edge_success_prob,
+                           optimal=False)
+
+def pack(options, order, owner=None, chosen=None):
+    """Take each option in order whose elements are all free.
+
+    Args:
+        owner: owner[e] is the option using element e or -1, which is updated
+        chosen: the set of options taken so far, which is updated
+
+    Returns:
+        (owner, chosen)
+    """
+
+    if owner is None:
+        owner = [-1] * options.n_elts
+        chosen = set()
+    score, elements = options.score, options.elements
+    for i in order:
+        if score[i] > EPS and i not in chosen and all(owner[e] < 0 for e in elements[i]):
+            chosen.add(i)
+            for e in elements[i]:
+                owner[e] = i
+    return owner, chosen
+
+def deadline_of(cfg):
+    """The time by which the time limit of an OptConfig expires, or None."""
+    return None if cfg.timelimit is None else time.time() + cfg.timelimit
+
+def local_search(options, order, owner, chosen, passes, deadline=None):
+    """Improve a packing for up to the given number of passes over the
+    options, or until the deadline. Each pass swaps an option in for the
+    options it conflicts with when that increases the score, then drops each
+    chosen option in turn and repacks the elements it frees, keeping the
+    change if that increases the score."""
+
+    score, elements = options.score.tolist(), options.elements
+    rank = [0] * len(order)
+    for r, i in enumerate(order):
+        rank[i] = r
+    elt_options = options.element_options()
+
+    def take(i):
+        chosen.add(i)
+        for e in elements[i]:
+            owner[e] = i
+
+    def drop(i):
+        chosen.remove(i)
+        for e in elements[i]:
+            owner[e] = -1
+
+    def expired():
+        return deadline is not None and time.time() > deadline
+
+    for __ in range(passes):
+        if expired():
+            break
+        improved = False
+        for i in order:
+            if i in chosen or score[i] <= EPS:
+                continue
+            conflicts = {owner[e] for e in elements[i] if owner[e] >= 0}
+            if score[i] > sum(score[j] for j in conflicts) + EPS:
+                for j in conflicts:
+                    drop(j)
+                take(i)
+                improved = True
+
+        for j in sorted(chosen, key=lambda i: rank[i]):
+            if expired():
+                return owner, chosen
+            candidates = sorted({i for e in elements[j] for i in elt_options[e] if i != j},
+                                key=lambda i: rank[i])
+            drop(j)
+            added = []
+            for i in candidates:
+                if score[i] > EPS and all(owner[e] < 0 for e in elements[i]):
+                    take(i)
+                    added.append(i)
+            if sum(score[i] for i in added) > score[j] + EPS:
+                improved = True
+            else:
+                for i in added:
+                    drop(i)
+                take(j)
+
+        if not improved:
+            break
+    return owner, chosen
+
+def optimise_greedy(cfg, passes=0):
+    """Pack cycles and chains greedily by score, then improve the packing
+    with up to passes rounds of local search.
+
+    Args:
+        cfg: an OptConfig object
+
+    Returns:
+        an OptSolution object
+    """
+
+    deadline = deadline_of(cfg)
+    options = Options(cfg)
+    order = np.argsort(-options.score, kind="stable").tolist()
+    owner, chosen = pack(options, order)
+    local_search(options, order, owner, chosen, passes, deadline)
+    return options.solution(cfg, chosen)
+
+def optimise_lp_rounding(cfg, passes=0):
+    """Solve the LP relaxation of the cycle formulation, pack cycles and
+    chains in order of their LP values, then improve the packing with up to
+    passes rounds of local search.
+
+    Args:
+        cfg: an OptConfig object
+
+    Returns:
+        an OptSolution object
+    """
+
+    deadline = deadline_of(cfg)
+    options = Options(cfg)
+    m = MipBuilder()
+    for s in options.score.tolist():
+        m.add_var(s)
+    for l in options.element_options():
+        m.add_constr([(i, 1) for i in l], 1)
+
+    # If the LP runs out of time, x is zero and the packing is greedy
+    time_left = None if deadline is None else max(deadline - time.time(), 0)
+    x = m.solve(time_left, cfg.verbose, relax=True)
+    order = np.lexsort((-options.score, -x)).tolist()
+    owner, chosen = pack(options, order)
+    local_search(options, order, owner, chosen, passes, deadline)
+    return options.solution(cfg, chosen)
@@ -0,0 +1,247 @@
+"""Solving the kidney-exchange problem using the HiGHS MIP solver shipped with
+SciPy, which needs no licence. PICEF and the cycle formulation are supported.
+"""
+
+import numpy as np
+import scipy.sparse
+
+from gym_kidney._solver.kidney_digraph import *
+from gym_kidney._solver.kidney_ndds import *
+from gym_kidney._solver.kidney_ip import OptSolution
+from gym_kidney._solver import kidney_utils
+
+try:
+    from scipy.optimize import milp, LinearConstraint, Bounds
+except ImportError:
+    milp = None
+
+class MipBuilder(object):
+    """Collects binary variables and sparse <= constraints for scipy's milp.
+
+    Data members:
+        obj: the objective coefficient of each variable (to be maximised)
+        rows, cols, vals: the constraint matrix in coordinate format
+        ub: the right-hand side of each constraint
+        optimal: after solving, True if and only if the solution was proven
+            optimal (within the gap)
+        gap: after solving, the relative gap between the solution and the
+            best bound
+        nodes: after solving, the number of branch-and-bound nodes explored
+    """
+
+    def __init__(self):
+        self.obj = []
+        self.rows = []
+        self.cols = []
+        self.vals = []
+        self.ub = []
+
+    def add_var(self, score):
+        """Add a binary variable with the given objective coefficient and
+        return its index."""
+        self.obj.append(score)
+        return len(self.obj) - 1
+
+    def add_constr(self, coeffs, ub):
+        """Add the constraint sum(val * x[var] for var, val in coeffs) <= ub."""
+        if len(coeffs) == 0:
+            return
+        row = len(self.ub)
+        for var, val in coeffs:
+            self.rows.append(row)
+            self.cols.append(var)
+            self.vals.append(val)
+        self.ub.append(ub)
+
+    def solve(self, time_limit, verbose, relax=False, gap=0):
+        """Solve the model, returning the 0-1 values of the variables, or if
+        relax is True, the values of the variables in the LP relaxation.
+
+        If the time limit expires before a solution is found, the empty
+        solution (all zeros) is returned, which is feasible for a packing and
+        for its relaxation.
+        """
+        if milp is None:
+            raise ImportError("The HiGHS backend needs scipy >= 1.9")
+
+        n = len(self.obj)
+        self.optimal, self.gap, self.nodes = True, 0, 0
+        if n == 0:
+            return np.zeros(0, dtype=float if relax else bool)
+
+        options = {"disp": verbose, "mip_rel_gap": gap}
+        if time_limit is not None:
+            options["time_limit"] = time_limit
+
+        constraints = []
+        if len(self.ub) > 0:
+            A = scipy.sparse.csr_matrix((self.vals, (self.rows, self.cols)),
+                                        shape=(len(self.ub), n))
+            constraints.append(LinearConstraint(A, -np.inf, self.ub))
+
+        self.result = milp(-np.array(self.obj, dtype=float),
+                           integrality=np.zeros(n) if relax else np.ones(n),
+                           bounds=Bounds(0, 1),
+                           constraints=constraints,
+                           options=options)
+        self.optimal = self.result.status == 0
+        self.nodes = getattr(self.result, "mip_node_count", None) or 0
+        if self.result.x is None:
+            # status 1 is an iteration or time limit; all zeros is feasible
+            # when no right-hand side is negative
+            if self.result.status != 1 or min(self.ub, default=0) < 0:
+                raise kidney_utils.KidneyOptimException(
+                        "HiGHS found no solution: {}".format(self.result.message))
+            self.gap = 1
+            return np.zeros(n, dtype=float if relax else bool)
+        self.gap = getattr(self.result, "mip_gap", None) or 0
+        return self.result.x if relax else self.result.x > 0.5
+
+def selected_chains(digraph, ndds, ndd_edge_vars, chain_next_vv, x, edge_success_prob=1):
+    """Build the chains selected in a PICEF solution.
+
+    Args:
+        ndd_edge_vars: for each NDD, a list of (NddEdge, var) pairs
+        chain_next_vv: a dict mapping each vertex id to the next vertex id in its chain
+        x: the 0-1 values of the variables
+    """
+
+    optimal_chains = []
+    for i, ndd in enumerate(ndds):
+        for e, var in ndd_edge_vars[i]:
+            if x[var]:
+                vtx_indices = kidney_utils.find_selected_path(e.target_v.id, chain_next_vv)
+                score = e.score * edge_success_prob
+                for j in range(len(vtx_indices) - 1):
+                    edge = digraph.adj_mat[vtx_indices[j]][vtx_indices[j+1]]
+                    score += edge.score * edge_success_prob**(j+2)
+                optimal_chains.append(Chain(i, vtx_indices, score))
+    return optimal_chains
+
+def optimise_picef(cfg):
+    """Optimise using the PICEF formulation.
+
+    Args:
+        cfg: an OptConfig object
+
+    Returns:
+        an OptSolution object
+    """
+
+    digraph, ndds, esp = cfg.digraph, cfg.ndds, cfg.edge_success_prob
+    max_chain = cfg.max_chain
+    cycles = cfg.find_cycles()
+    m = MipBuilder()
+
+    cycle_vars = [m.add_var(failure_aware_cycle_score(c, digraph, esp)) for c in cycles]
+    vtx_to_vars = [[] for __ in digraph.vs]
+    for c, var in zip(cycles, cycle_vars):
+        for v in c:
+            vtx_to_vars[v.id].append(var)
+
+    # chain_in[pos][v] and chain_out[pos][v] are the variables for chain edges
+    # into and out of v at each chain position
+    ndd_edge_vars = [[] for __ in ndds]
+    chain_edge_vars = []  # (Edge, var) pairs
+    if max_chain > 0:
+        chain_in = [[[] for __ in digraph.vs] for __ in range(max_chain - 1)]
+        chain_out = [[[] for __ in digraph.vs] for __ in range(max_chain - 1)]
+
+        for i, ndd in enumerate(ndds):
+            for e in ndd.edges:
+                var = m.add_var(e.score * esp)
+                ndd_edge_vars[i].append((e, var))
+                vtx_to_vars[e.target_v.id].append(var)
+                if max_chain > 1:
+                    chain_in[0][e.target_v.id].append(var)
+            m.add_constr([(var, 1) for __, var in ndd_edge_vars[i]], 1)
+
+        dists_from_ndd = kidney_utils.get_dist_from_nearest_ndd(digraph, ndds)
+        for e in digraph.es:
+            for i in range(max_chain - 1):
+                if dists_from_ndd[e.src.id] <= i + 1:
+                    var = m.add_var(e.score * esp**(i + 2))
+                    chain_edge_vars.append((e, var))
+                    vtx_to_vars[e.tgt.id].append(var)
+                    chain_out[i][e.src.id].append(var)
+                    if i < max_chain - 2:
+                        chain_in[i + 1][e.tgt.id].append(var)
+
+        # At each chain position, sum of edges out of a vertex must be <= sum of edges in
+        for i in range(max_chain - 1):
+            for v in digraph.vs:
+                m.add_constr([(var, 1) for var in chain_out[i][v.id]] +
+                             [(var, -1) for var in chain_in[i][v.id]], 0)
+
+    for l in vtx_to_vars:
+        m.add_constr([(var, 1) for var in l], 1)
+
+    x = m.solve(cfg.timelimit, cfg.verbose, gap=cfg.gap)
+
+    chain_next_vv = {e.src.id: e.tgt.id for e, var in chain_edge_vars if x[var]}
+    return OptSolution(ip_model=None,
+                       cycles=[c for c, var in zip(cycles, cycle_vars) if x[var]],
+                       chains=selected_chains(digraph, ndds, ndd_edge_vars,
+                                              chain_next_vv, x, esp),
+                       digraph=digraph,
+                       edge_success_prob=esp,
+                       optimal=m.optimal,
+                       gap=m.gap,
+                       nodes=m.nodes)
+
+def optimise_ccf(cfg):
+    """Optimise using the cycle formulation (with one var per cycle and one var per chain).
+
+    Args:
+        cfg: an OptConfig object
+
+    Returns:
+        an OptSolution object
+    """
+
+    digraph, esp = cfg.digraph, cfg.edge_success_prob
+    cycles = cfg.find_cycles()
+    m = MipBuilder()
+
+    cycle_vars = [m.add_var(failure_aware_cycle_score(c, digraph, esp)) for c in cycles]
+
+    ndd_to_vars = [[] for __ in cfg.ndds]
+    vtx_to_vars = [[] for __ in digraph.vs]
+
+    for var, c in zip(cycle_vars, cycles):
+        for v in c:
+            vtx_to_vars[v.id].append(var)
+
+    # Chains are added a batch at a time. Only (var, NDD, vertices, score)
+    # of each chain is kept to decode the solution, and the arrays of each
+    # batch are dropped once its variables are added
+    chain_vars = []
+    stream = cfg.chain_stream()
+    for batch in stream:
+        for ndd_idx, row, score in zip(batch.ndd_index.tolist(),
+                                       batch.vtx_indices.tolist(),
+                                       batch.score.tolist()):
+            var = m.add_var(score)
+            vtxs = [v for v in row if v >= 0]
+            ndd_to_vars[ndd_idx].append(var)
+            for v in vtxs:
+                vtx_to_vars[v].append(var)
+            chain_vars.append((var, ndd_idx, vtxs, score))
+    if stream.truncated and cfg.verbose:
+        print("chain enumeration stopped at {} chains".format(stream.count))
+
+    # Each donor-patient pair and each each NDD is in at most one chosen cycle or chain
+    for l in vtx_to_vars + ndd_to_vars:
+        m.add_constr([(var, 1) for var in l], 1)
+
+    x = m.solve(cfg.timelimit, cfg.verbose, gap=cfg.gap)
+
+    return OptSolution(ip_model=None,
+                       cycles=[c for c, var in zip(cycles, cycle_vars) if x[var]],
+                       chains=[Chain(ndd_idx, vtxs, score)
+                               for var, ndd_idx, vtxs, score in chain_vars if x[var]],
+                       digraph=digraph,
+                       edge_success_prob=esp,
+                       optimal=m.optimal,
+                       gap=m.gap,
+                       nodes=m.nodes)
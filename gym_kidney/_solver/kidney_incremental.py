@@ -0,0 +1,397 @@
+"""Solving PICEF repeatedly on a pool that changes a little between solves.
+
+The model is kept between solves. Vertices are identified by uids that are
+never reused, so each solve only removes and adds the variables of cycles
+that joined or left the CycleIndex and of chain edges that touch vertices
+whose edges changed, and starts from the previous incumbent.
+"""
+
+import time
+
+import numpy as np
+import scipy.sparse
+
+from gym_kidney._solver import kidney_ip
+from gym_kidney._solver import kidney_utils
+from gym_kidney._solver.kidney_highs import MipBuilder
+from gym_kidney._solver.kidney_cycle_index import CycleIndex, edge_keys
+
+try:
+    from gurobipy import *
+except ImportError:
+    GRB = None
+
+class IncrementalVar(object):
+    """A binary variable of an IncrementalPicef model.
+
+    Data members:
+        score: the objective coefficient
+        coeffs: a list of (constraint key, coefficient) pairs
+        uids: the uids of the vertices the variable touches
+        edge: the key of the edge the variable uses, or None for a cycle
+        grb_var: the Gurobi Var, or None for the HiGHS backend
+    """
+
+    __slots__ = ["score", "coeffs", "uids", "edge", "grb_var"]
+
+    def __init__(self, score, coeffs, uids, edge=None):
+        self.score = score
+        self.coeffs = coeffs
+        self.uids = uids
+        self.edge = edge
+        self.grb_var = None
+
+class IncrementalPicef(object):
+    """A PICEF model kept between solves of an evolving pool.
+
+    Variable keys are ("c", uids) for a cycle with its uids rotated to start at
+    the smallest, ("e", ndd, v) for an edge from an NDD, and ("p", u, v, i) for
+    a pair-to-pair edge at position i of a chain. Constraint keys are ("v", v)
+    for the capacity of a pair, ("n", ndd) for an NDD and ("f", v, i) for flow
+    conservation at position i.
+
+    Data members:
+        max_cycle
+        max_chain
+        edge_success_prob
+        timelimit
+        gap: the relative MIP gap at which the solver may stop
+        verbose
+        backend: "gurobi" to keep a Gurobi model, or "highs" to rebuild a HiGHS
+            model from the kept variables on each solve
+        vars: a dict from each variable key to its IncrementalVar
+        constrs: a dict from each constraint key to [ub, Gurobi Constr or None]
+        cycle_index: the CycleIndex of the pool
+        chosen: the keys of the variables in the last incumbent
+        score: the objective value of the last incumbent
+        optimal: whether the last incumbent was proven optimal (within the gap)
+        last_gap: the relative gap of the last incumbent
+        nodes: the number of branch-and-bound nodes of the last solve
+        solve_time: the seconds taken by the last solve
+    """
+
+    def __init__(self, max_cycle, max_chain, edge_success_prob=1,
+                 timelimit=None, verbose=False, backend="gurobi", gap=0):
+        if backend not in ("gurobi", "highs"):
+            raise ValueError("Incremental PICEF supports the gurobi and highs backends")
+
+        self.max_cycle = max_cycle
+        self.max_chain = max_chain
+        self.edge_success_prob = edge_success_prob
+        self.timelimit = timelimit
+        self.gap = gap
+        self.verbose = verbose
+        self.backend = backend
+
+        self.vars = {}
+        self.constrs = {}
+        self.cycle_index = CycleIndex(max_cycle)
+        self.chosen = set()
+        self.score = 0
+        self.optimal = True
+        self.last_gap = 0
+        self.nodes = 0
+        self.solve_time = 0
+
+        self.model = None
+        if backend == "gurobi":
+            self.model = kidney_ip.create_ip_model(timelimit, verbose, gap)
+            self.model.modelSense = GRB.MAXIMIZE
+
+        # inverted indices from uids and edge keys to variable keys
+        self.vtx_vars = {}
+        self.vtx_constrs = {}
+        self.edge_vars = {}
+
+        # the pool as of the last solve, by uid
+        self.uids = np.zeros(0, dtype=np.int64)
+        self.dists = np.zeros(0, dtype=int)
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.weights = np.zeros(0)
+
+    def solve(self, uid, ndd, src, tgt, weight):
+        """Update the model to the pool and solve it.
+
+        Args:
+            uid: the uid of the vertex in each slot
+            ndd: whether the vertex in each slot is an NDD
+            src, tgt, weight: the edges, by slot
+
+        Returns:
+            (cycles, chains), where cycles is a list of arrays of the slots in
+            each chosen cycle and chains is a list of (NDD slot, array of slots)
+            pairs for the chosen chains
+        """
+
+        n = len(uid)
+        uid = np.asarray(uid, dtype=np.int64)
+        ndd = np.asarray(ndd, dtype=bool)
+        keep = ~ndd[tgt]
+        src, tgt = np.asarray(src)[keep], np.asarray(tgt)[keep]
+        weight = np.asarray(weight, dtype=float)[keep]
+
+        keys = edge_keys(uid[src], uid[tgt])
+        order = np.argsort(keys)
+        src, tgt, weight, keys = src[order], tgt[order], weight[order], keys[order]
+
+        # what changed since the last solve
+        dead = np.setdiff1d(self.uids, uid, assume_unique=True)
+        arrived = np.setdiff1d(uid, self.uids, assume_unique=True)
+        __, i_new, i_old = np.intersect1d(keys, self.keys,
+                                          assume_unique=True, return_indices=True)
+        reweighted = i_new[weight[i_new] != self.weights[i_old]]
+        gone = np.setdiff1d(self.keys, keys, assume_unique=True)
+        added = np.flatnonzero(~np.isin(keys, self.keys, assume_unique=True))
+        changed = np.union1d(added, reweighted)
+
+        for u in dead.tolist():
+            self.remove_vertex(u)
+        for key in np.concatenate([gone, keys[reweighted]]).tolist():
+            for var_key in list(self.edge_vars.get(key, ())):
+                self.remove_var(var_key)
+
+        for v in np.flatnonzero(np.isin(uid, arrived, assume_unique=True)).tolist():
+            self.add_vertex(int(uid[v]), bool(ndd[v]))
+        if self.model is not None:
+            self.model.update()
+
+        self.update_cycles(uid, ndd, src, tgt, keys, weight, reweighted)
+        dists = self.add_chain_vars(n, uid, ndd, src, tgt, weight, keys, changed)
+
+        chosen = self.optimise()
+
+        self.uids = np.sort(uid)
+        self.dists = dists[np.argsort(uid)]
+        self.keys = keys
+        self.weights = weight
+
+        return self.selected(uid, chosen)
+
+    def add_vertex(self, u, is_ndd):
+        """Add the constraints of a vertex."""
+        if is_ndd:
+            ckeys = [("n", u)] if self.max_chain > 0 else []
+        else:
+            ckeys = [("v", u)] + [("f", u, i) for i in range(self.max_chain - 1)]
+        for ckey in ckeys:
+            ub = 0 if ckey[0] == "f" else 1
+            grb_constr = None
+            if self.model is not None:
+                grb_constr = self.model.addConstr(LinExpr() <= ub)
+            self.constrs[ckey] = [ub, grb_constr]
+        self.vtx_constrs[u] = ckeys
+
+    def remove_vertex(self, u):
+        """Remove a vertex with its constraints and the variables touching it."""
+        for var_key in list(self.vtx_vars.pop(u, ())):
+            self.remove_var(var_key)
+        for ckey in self.vtx_constrs.pop(u, ()):
+            ub, grb_constr = self.constrs.pop(ckey)
+            if grb_constr is not None:
+                self.model.remove(grb_constr)
+
+    def add_var(self, key, var):
+        """Add a variable, indexing it by its vertices and edge."""
+        self.vars[key] = var
+        for u in var.uids:
+            self.vtx_vars.setdefault(u, set()).add(key)
+        if var.edge is not None:
+            self.edge_vars.setdefault(var.edge, set()).add(key)
+        if self.model is not None:
+            col = Column([c for __, c in var.coeffs],
+                         [self.constrs[ckey][1] for ckey, __ in var.coeffs])
+            var.grb_var = self.model.addVar(vtype=GRB.BINARY, obj=var.score, column=col)
+
+    def remove_var(self, key):
+        """Remove a variable and its index entries."""
+        var = self.vars.pop(key, None)
+        if var is None:
+            return
+        for u in var.uids:
+            keys = self.vtx_vars.get(u)
+            if keys is not None:
+                keys.discard(key)
+        if var.edge is not None:
+            keys = self.edge_vars[var.edge]
+            keys.discard(key)
+            if not keys:
+                del self.edge_vars[var.edge]
+        if var.grb_var is not None:
+            self.model.remove(var.grb_var)
+            var.grb_var = None
+        self.chosen.discard(key)
+
+    def update_cycles(self, uid, ndd, src, tgt, keys, weight, reweighted):
+        """Add and remove cycle variables as the cycle index changes, and
+        rescore the cycles through edges whose weight changed."""
+
+        removed, added = self.cycle_index.update(uid, ndd, src, tgt)
+        for c in removed:
+            self.remove_var(("c", c))
+
+        rescored = set()
+        for key in keys[reweighted].tolist():
+            rescored.update(self.cycle_index.cycles_through(key >> 32))
+        rescored = [c for c in rescored if ("c", c) in self.vars]
+
+        esp = self.edge_success_prob
+        scores = cycle_weights(added + rescored, keys, weight)
+        for c, score in zip(added, scores[:len(added)].tolist()):
+            self.add_var(("c", c), IncrementalVar(score * esp**len(c),
+                                                  [(("v", u), 1) for u in c], c))
+        for c, score in zip(rescored, scores[len(added):].tolist()):
+            var = self.vars[("c", c)]
+            var.score = score * esp**len(c)
+            if var.grb_var is not None:
+                var.grb_var.obj = var.score
+
+    def add_chain_vars(self, n, uid, ndd, src, tgt, weight, keys, changed):
+        """Add and remove chain variables for the changed edges and the edges
+        out of vertices whose distance from the nearest NDD changed.
+
+        Returns:
+            the distance of each slot from the nearest NDD, capped at max_chain
+        """
+
+        L = self.max_chain
+        dists = np.full(n, L, dtype=int)
+        if L == 0:
+            return dists
+
+        # breadth-first search from the NDDs, up to the last chain position
+        is_pair = ~ndd[src]
+        A = scipy.sparse.csr_matrix((np.ones(is_pair.sum()), (src[is_pair], tgt[is_pair])),
+                                    shape=(n, n))
+        frontier = np.zeros(n, dtype=bool)
+        frontier[tgt[~is_pair]] = True
+        for d in range(1, L):
+            frontier &= dists == L
+            if not frontier.any():
+                break
+            dists[frontier] = d
+            frontier = A.T.dot(frontier.astype(float)) > 0
+
+        moved = np.zeros(n, dtype=bool)
+        if len(self.uids) > 0:
+            prev = np.minimum(np.searchsorted(self.uids, uid), len(self.uids) - 1)
+            moved = (self.uids[prev] == uid) & (self.dists[prev] != dists)
+
+        refresh = np.union1d(changed, np.flatnonzero(moved[src] & is_pair))
+        esp = self.edge_success_prob
+
+        for j in refresh.tolist():
+            u, v, key, w = int(src[j]), int(tgt[j]), int(keys[j]), float(weight[j])
+            uid_u, uid_v = int(uid[u]), int(uid[v])
+            if ndd[u]:
+                var_key = ("e", uid_u, uid_v)
+                if var_key not in self.vars:
+                    coeffs = [(("n", uid_u), 1), (("v", uid_v), 1)]
+                    if L > 1:
+                        coeffs.append((("f", uid_v, 0), -1))
+                    self.add_var(var_key, IncrementalVar(w * esp, coeffs, (uid_u, uid_v), key))
+                continue
+
+            wanted = set(range(max(dists[u] - 1, 0), L - 1))
+            for var_key in list(self.edge_vars.get(key, ())):
+                if var_key[3] not in wanted:
+                    self.remove_var(var_key)
+            for i in wanted:
+                var_key = ("p", uid_u, uid_v, i)
+                if var_key not in self.vars:
+                    coeffs = [(("v", uid_v), 1), (("f", uid_u, i), 1)]
+                    if i < L - 2:
+                        coeffs.append((("f", uid_v, i + 1), -1))
+                    self.add_var(var_key, IncrementalVar(w * esp**(i + 2), coeffs,
+                                                         (uid_u, uid_v), key))
+
+        return dists
+
+    def feasible_start(self):
+        """Return the variables of the last incumbent if, after the changes
+        since, they still satisfy every constraint together, or else the empty
+        set."""
+        load = {}
+        for key in self.chosen:
+            for ckey, c in self.vars[key].coeffs:
+                load[ckey] = load.get(ckey, 0) + c
+        if all(l <= self.constrs[ckey][0] + kidney_utils.EPS for ckey, l in load.items()):
+            return self.chosen
+        return set()
+
+    def optimise(self):
+        """Solve the model, starting from the last incumbent where it is still
+        feasible and otherwise from the empty solution, and return the keys of
+        the chosen variables. If the time limit expires before a solution is
+        found, nothing is chosen."""
+
+        start_time = time.time()
+        if self.model is None:
+            m = MipBuilder()
+            rows = {ckey: [] for ckey in self.constrs}
+            var_keys = list(self.vars)
+            for key in var_keys:
+                var = self.vars[key]
+                j = m.add_var(var.score)
+                for ckey, c in var.coeffs:
+                    rows[ckey].append((j, c))
+            for ckey, coeffs in rows.items():
+                m.add_constr(coeffs, self.constrs[ckey][0])
+            x = m.solve(self.timelimit, self.verbose, gap=self.gap)
+            chosen = set(k for k, x_k in zip(var_keys, x) if x_k)
+            self.optimal, self.last_gap, self.nodes = m.optimal, m.gap, m.nodes
+        else:
+            self.model.update()
+            start = self.feasible_start()
+            var_keys = list(self.vars)
+            grb_vars = [self.vars[k].grb_var for k in var_keys]
+            for k, v in zip(var_keys, grb_vars):
+                v.start = 1 if k in start else 0
+            self.model.optimize()
+            self.optimal = self.model.status == GRB.OPTIMAL
+            self.nodes = int(self.model.NodeCount)
+            if self.model.solCount == 0:
+                if self.model.status != GRB.TIME_LIMIT:
+                    raise kidney_utils.KidneyOptimException(
+                            "Gurobi found no solution (status {})".format(self.model.status))
+                chosen, self.last_gap = set(), 1
+            else:
+                x = self.model.getAttr("X", grb_vars) if grb_vars else []
+                chosen = set(k for k, x_k in zip(var_keys, x) if x_k > 0.5)
+                self.last_gap = self.model.MIPGap if self.model.IsMIP else 0
+        self.solve_time = time.time() - start_time
+        self.chosen = chosen
+        self.score = sum(self.vars[k].score for k in chosen)
+        return chosen
+
+    def selected(self, uid, chosen):
+        """Map the chosen cycles and chains back to slots."""
+        order = np.argsort(uid)
+        sorted_uid = uid[order]
+
+        def slots(us):
+            return order[np.searchsorted(sorted_uid, np.asarray(us, dtype=np.int64))]
+
+        keys = [k for k in self.vars if k in chosen]
+        next_vtx = {k[1]: k[2] for k in keys if k[0] == "p"}
+
+        cycles = [slots(k[1]) for k in keys if k[0] == "c"]
+        chains = []
+        for k in keys:
+            if k[0] == "e":
+                vs = [k[2]]
+                while vs[-1] in next_vtx:
+                    vs.append(next_vtx[vs[-1]])
+                chains.append((int(slots([k[1]])[0]), slots(vs)))
+
+        return cycles, chains
+
+def cycle_weights(cycles, keys, weight):
+    """The total edge weight of each cycle of uids, given the sorted edge keys
+    and their weights."""
+    if len(cycles) == 0:
+        return np.zeros(0)
+    src = [u for c in cycles for u in c]
+    tgt = [c[(i + 1) % len(c)] for c in cycles for i in range(len(c))]
+    ws = weight[np.searchsorted(keys, edge_keys(np.array(src), np.array(tgt)))]
+    starts = np.cumsum([0] + [len(c) for c in cycles[:-1]])
+    return np.add.reduceat(ws, starts)
@@ -2,12 +2,16 @@
 
 import copy
 import sys
+import threading
 
 from gym_kidney._solver.kidney_digraph import *
 from gym_kidney._solver.kidney_ndds import *
 from gym_kidney._solver import kidney_utils
 
-from gurobipy import *
+try:
+    from gurobipy import *
+except ImportError:
+    GRB = None
 
 ###################################################################################################
 #                                                                                                 #
@@ -29,11 +33,17 @@ class OptConfig(object):
         eef_alt_constraints: True if and only if alternative EEF constraints should be used
         lp_file: The name of a .lp file to write, or None if the file should not be written
         relax: True if and only if the LP relaxation should be solved also
+        cycles: The cycles of the digraph of at most max_cycle vertices, each a
+            list of vertices (for example from a CycleIndex), or None if the
+            formulations should find them
+        chain_limit: The most chains the cycle formulation enumerates, or None
+            for no limit. With a limit the solution may not be optimal.
+        gap: The relative MIP gap at which the solver may stop
     """
 
     def __init__(self, digraph, ndds, max_cycle, max_chain, verbose=False,
                  timelimit=None, edge_success_prob=1, eef_alt_constraints=False,
-                 lp_file=None, relax=False):
+                 lp_file=None, relax=False, cycles=None, chain_limit=None, gap=0):
         self.digraph = digraph
         self.ndds = ndds
         self.max_cycle = max_cycle
@@ -44,20 +54,40 @@ class OptConfig(object):
         self.eef_alt_constraints = eef_alt_constraints
         self.lp_file = lp_file
         self.relax = relax
+        self.cycles = cycles
+        self.chain_limit = chain_limit
+        self.gap = gap
+
+    def find_cycles(self):
+        """Return the given cycles, or find the cycles of the digraph."""
+        if self.cycles is not None:
+            return self.cycles
+        return self.digraph.find_cycles(self.max_cycle)
+
+    def chain_stream(self):
+        """Return a ChainStream of the chains of at most max_chain edges."""
+        return ChainStream(self.digraph, self.ndds, self.max_chain,
+                           self.edge_success_prob, limit=self.chain_limit)
 
 class OptSolution(object):
     """An optimal solution for a kidney-exchange problem instance.
     
     Data members:
-        ip_model: The Gurobi Model object
+        ip_model: The Gurobi Model object, or None for the other backends
         cycles: A list of cycles in the optimal solution, each represented
             as a list of vertices
         chains: A list of chains in the optimal solution, each represented
             as a Chain object
         total_score: The total score of the solution
+        optimal: True if and only if the solution was proven optimal (within
+            the gap of the OptConfig), which by default is when ip_model is
+            None or Gurobi reports optimality
+        gap: The relative gap between the solution and the best bound
+        nodes: The number of branch-and-bound nodes explored
     """
 
-    def __init__(self, ip_model, cycles, chains, digraph, edge_success_prob=1):
+    def __init__(self, ip_model, cycles, chains, digraph, edge_success_prob=1,
+                 optimal=None, gap=None, nodes=None):
         self.ip_model = ip_model
         self.cycles = cycles
         self.chains = chains
@@ -65,6 +95,16 @@ class OptSolution(object):
         self.total_score = (sum(c.score for c in chains) +
                 sum(failure_aware_cycle_score(c, digraph, edge_success_prob) for c in cycles))
         self.edge_success_prob = edge_success_prob
+        if optimal is None:
+            optimal = ip_model is None or ip_model.status == GRB.OPTIMAL
+        self.optimal = optimal
+        if ip_model is not None and ip_model.IsMIP:
+            if gap is None:
+                gap = ip_model.MIPGap
+            if nodes is None:
+                nodes = int(ip_model.NodeCount)
+        self.gap = gap or 0
+        self.nodes = nodes or 0
 
     def display(self):
         """Print the optimal cycles and chains to standard output."""
@@ -101,7 +141,8 @@ class OptSolution(object):
                                    c.score)
                              for c in self.chains]
         return OptSolution(self.ip_model, relabelled_cycles, relabelled_chains,
-                           new_digraph, self.edge_success_prob)
+                           new_digraph, self.edge_success_prob, self.optimal,
+                           self.gap, self.nodes)
 
 def optimise(model, cfg):
     if cfg.lp_file:
@@ -116,6 +157,12 @@ def optimise(model, cfg):
         print("lp_relax_solver_status:", r.status)
         sys.exit(0)
     else:
+        # The empty solution is feasible, so starting from it means there is
+        # an incumbent to return if the time limit expires
+        if cfg.timelimit is not None:
+            model.update()
+            for v in model.getVars():
+                v.start = 0
         model.optimize()
 
 def optimise_relabelled(formulation_fun, cfg):
@@ -142,17 +189,38 @@ def optimise_relabelled(formulation_fun, cfg):
     relabelled_cfg = copy.copy(cfg)
     relabelled_cfg.digraph = relabelled_digraph
     relabelled_cfg.ndds = relabelled_ndds
+    if cfg.cycles is not None:
+        relabelled_cfg.cycles = [[old_to_new_vtx[v.id] for v in c] for c in cfg.cycles]
 
     opt_result = formulation_fun(relabelled_cfg)
     return opt_result.relabelled_copy(sorted_vertices, cfg.digraph)
 
-def create_ip_model(time_limit, verbose):
+# The Gurobi environments of threads other than the main thread
+thread_envs = threading.local()
+
+def thread_env():
+    """Return the Gurobi environment for models created on this thread: None,
+    for the default environment, on the main thread, and an environment of
+    the thread's own on any other thread, since models optimised at the same
+    time must not share an environment."""
+
+    if threading.current_thread() is threading.main_thread():
+        return None
+    env = getattr(thread_envs, "env", None)
+    if env is None:
+        env = thread_envs.env = Env()
+    return env
+
+def create_ip_model(time_limit, verbose, gap=0):
     """Create a Gurobi Model."""
 
-    m = Model("kidney-mip")
+    if GRB is None:
+        raise ImportError("gurobipy is not installed; use the highs or bnb backend")
+
+    m = Model("kidney-mip", env=thread_env())
     if not verbose:
         m.params.outputflag = 0
-    m.params.mipGap = 0
+    m.params.mipGap = gap
     if time_limit is not None:
         m.params.timelimit = time_limit
     return m
@@ -217,7 +285,7 @@ def optimise_uuef(cfg):
     if cfg.edge_success_prob != 1:
         raise ValueError("This formulation does not support failure-aware matching.")
 
-    m = create_ip_model(cfg.timelimit, cfg.verbose)
+    m = create_ip_model(cfg.timelimit, cfg.verbose, cfg.gap)
 
     add_unlimited_vars_and_constraints(cfg.digraph, cfg.ndds, m)
 
@@ -426,7 +494,7 @@ def optimise_hpief_prime(cfg, full_red=False, hpief_2_prime=False):
     if cfg.max_cycle < 3:
         hpief_2_prime = False
 
-    m = create_ip_model(cfg.timelimit, cfg.verbose)
+    m = create_ip_model(cfg.timelimit, cfg.verbose, cfg.gap)
     m.params.method = 2
     m.params.presolve = 0
 
@@ -511,9 +579,9 @@ def optimise_picef(cfg):
         an OptSolution object
     """
 
-    cycles = cfg.digraph.find_cycles(cfg.max_cycle)
+    cycles = cfg.find_cycles()
 
-    m = create_ip_model(cfg.timelimit, cfg.verbose)
+    m = create_ip_model(cfg.timelimit, cfg.verbose, cfg.gap)
     m.params.method = 2
 
     cycle_vars = [m.addVar(vtype=GRB.BINARY) for __ in cycles]
@@ -573,15 +641,15 @@ def optimise_ccf(cfg):
         an OptSolution object
     """
 
-    cycles = cfg.digraph.find_cycles(cfg.max_cycle)
-    chains = find_chains(cfg.digraph, cfg.ndds, cfg.max_chain, cfg.edge_success_prob)
+    cycles = cfg.find_cycles()
         
-    m = create_ip_model(cfg.timelimit, cfg.verbose)
+    m = create_ip_model(cfg.timelimit, cfg.verbose, cfg.gap)
     m.params.method = 2
+    m.modelSense = GRB.MAXIMIZE
 
-    cycle_vars = [m.addVar(vtype=GRB.BINARY) for __ in cycles]
-    chain_vars = [m.addVar(vtype=GRB.BINARY) for __ in chains]
-    m.update()
+    cycle_vars = [m.addVar(vtype=GRB.BINARY,
+                           obj=failure_aware_cycle_score(c, cfg.digraph, cfg.edge_success_prob))
+                  for c in cycles]
     
     ndd_to_vars = [[] for __ in cfg.ndds]
     vtx_to_vars = [[] for __ in cfg.digraph.vs]
@@ -590,26 +658,36 @@ def optimise_ccf(cfg):
         for v in c:
             vtx_to_vars[v.id].append(var)
 
-    for var, c in zip(chain_vars, chains):
-        ndd_to_vars[c.ndd_index].append(var)
-        for v in c.vtx_indices:
-            vtx_to_vars[v].append(var)
+    # Chains are added a batch at a time. Only (var, NDD, vertices, score)
+    # of each chain is kept to decode the solution, and the arrays of each
+    # batch are dropped once its variables are added
+    chain_vars = []
+    stream = cfg.chain_stream()
+    for batch in stream:
+        for ndd_idx, row, score in zip(batch.ndd_index.tolist(),
+                                       batch.vtx_indices.tolist(),
+                                       batch.score.tolist()):
+            var = m.addVar(vtype=GRB.BINARY, obj=score)
+            vtxs = [v for v in row if v >= 0]
+            ndd_to_vars[ndd_idx].append(var)
+            for v in vtxs:
+                vtx_to_vars[v].append(var)
+            chain_vars.append((var, ndd_idx, vtxs, score))
+    if stream.truncated and cfg.verbose:
+        print("chain enumeration stopped at {} chains".format(stream.count))
+    m.update()
 
     # Each donor-patient pair and each each NDD is in at most one chosen cycle or chain
     for l in vtx_to_vars + ndd_to_vars:
         if len(l) > 0:
             m.addConstr(quicksum(l) <= 1)
-
-    obj_expr = (quicksum(failure_aware_cycle_score(c, cfg.digraph, cfg.edge_success_prob) * var
-                         for (c, var) in zip(cycles, cycle_vars)) +
-                quicksum(c.score * var for (c, var) in zip(chains, chain_vars)))
         
-    m.setObjective(obj_expr, GRB.MAXIMIZE)
     optimise(m, cfg)
 
     return OptSolution(ip_model=m,
                        cycles=[c for c, v in zip(cycles, cycle_vars) if v.x > 0.5],
-                       chains=[c for c, v in zip(chains, chain_vars) if v.x > 0.5],
+                       chains=[Chain(ndd_idx, vtxs, score)
+                               for v, ndd_idx, vtxs, score in chain_vars if v.x > 0.5],
                        digraph=cfg.digraph,
                        edge_success_prob=cfg.edge_success_prob)
 
@@ -751,7 +829,7 @@ def optimise_eef(cfg, full_red=False):
     if cfg.edge_success_prob != 1:
         raise ValueError("This formulation does not support failure-aware matching.")
 
-    m = create_ip_model(cfg.timelimit, cfg.verbose)
+    m = create_ip_model(cfg.timelimit, cfg.verbose, cfg.gap)
     m.params.method = 2
     m.params.presolve = 0
 
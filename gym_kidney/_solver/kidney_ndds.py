@@ -7,10 +7,15 @@ each of these edges points towards a vertex (which represents a donor-patient pa
 in the directed graph.
 """
 
+import numpy as np
+
 from gym_kidney._solver.kidney_digraph import KidneyReadException
 
 class Ndd:
     """A non-directed donor"""
+
+    __slots__ = ["edges"]
+
     def __init__(self):
         self.edges = []
     def add_edge(self, ndd_edge):
@@ -19,7 +24,13 @@ class Ndd:
         self.edges.append(ndd_edge)
 
 class NddEdge:
-    """An edge pointing from an NDD to a vertex in the directed graph"""
+    """An edge pointing from an NDD to a vertex in the directed graph.
+
+    The edge_var slot holds a Gurobi variable while a formulation is built.
+    """
+
+    __slots__ = ["target_v", "score", "edge_var"]
+
     def __init__(self, target_v, score):
         self.target_v = target_v
         self.score = score
@@ -37,6 +48,16 @@ def create_relabelled_ndds(ndds, old_to_new_vtx):
 
     return new_ndds
 
+def ndds_from_arrays(ndd_count, digraph, src, tgt, score):
+    """Builds ndd_count NDDs from sequences of the NDD index, target vertex id
+    and score of each edge, without checking them."""
+
+    ndds = [Ndd() for _ in range(ndd_count)]
+    vs = digraph.vs
+    for src_id, tgt_id, w in zip(src, tgt, score):
+        ndds[src_id].edges.append(NddEdge(vs[tgt_id], w))
+    return ndds
+
 def read_ndds(lines, digraph):
     """Reads NDDs from an array of strings in the .ndd format."""
 
@@ -110,23 +131,119 @@ class Chain(object):
                     return 1
         return 0
             
+class ChainBatch(object):
+    """A batch of chains initiated by NDDs, stored as arrays.
+
+    Data members:
+        ndd_index: The index of the NDD of each chain
+        vtx_indices: An array with one row per chain, holding the indices of
+            its vertices in order, padded with -1
+        score: the score of each chain
+    """
+
+    def __init__(self, ndd_index, vtx_indices, score):
+        self.ndd_index = ndd_index
+        self.vtx_indices = vtx_indices
+        self.score = score
+
+    def __len__(self):
+        return len(self.score)
+
+    def chain(self, i):
+        """Return chain i of the batch as a Chain object."""
+        row = self.vtx_indices[i]
+        return Chain(int(self.ndd_index[i]), row[row >= 0].tolist(), float(self.score[i]))
+
+class ChainStream(object):
+    """Generates the chains with up to max_chain edges in batches, in the same
+    order as find_chains, so that only one batch is held in memory at a time.
+
+    Data members:
+        count: the number of chains generated so far
+        truncated: True if and only if generation stopped at the limit with
+            chains left to find
+    """
+
+    def __init__(self, digraph, ndds, max_chain, edge_success_prob=1,
+                 batch_size=4096, limit=None):
+        self.digraph = digraph
+        self.ndds = ndds
+        self.max_chain = max_chain
+        self.edge_success_prob = edge_success_prob
+        self.batch_size = batch_size
+        self.limit = limit
+        self.count = 0
+        self.truncated = False
+
+    def __iter__(self):
+        self.count = 0
+        self.truncated = False
+        max_chain, esp = self.max_chain, self.edge_success_prob
+        if max_chain == 0:
+            return
+
+        vs = self.digraph.vs
+        vtx_used = [False] * len(vs)
+        size = self.batch_size
+        ndd_index = np.empty(size, dtype=np.int32)
+        vtx_indices = np.full((size, max_chain), -1, dtype=np.int32)
+        score = np.empty(size)
+        k = 0
+
+        for ndd_idx, ndd in enumerate(self.ndds):
+            for e in ndd.edges:
+                # depth-first search, where next_edge[i] is the position in
+                # the edge list of vertices[i] of the next edge to try
+                vertices = [e.target_v.id]
+                scores = [e.score * esp]
+                next_edge = [0]
+                vtx_used[vertices[0]] = True
+                new_chain = True
+
+                while vertices:
+                    if new_chain:
+                        if self.limit is not None and self.count == self.limit:
+                            self.truncated = True
+                            for v in vertices:
+                                vtx_used[v] = False
+                            if k > 0:
+                                yield ChainBatch(ndd_index[:k], vtx_indices[:k], score[:k])
+                            return
+                        ndd_index[k] = ndd_idx
+                        vtx_indices[k, :len(vertices)] = vertices
+                        score[k] = scores[-1]
+                        k += 1
+                        self.count += 1
+                        if k == size:
+                            yield ChainBatch(ndd_index, vtx_indices, score)
+                            ndd_index = np.empty(size, dtype=np.int32)
+                            vtx_indices = np.full((size, max_chain), -1, dtype=np.int32)
+                            score = np.empty(size)
+                            k = 0
+                        new_chain = False
+
+                    edges = vs[vertices[-1]].edges
+                    i = next_edge[-1]
+                    if len(vertices) < max_chain and i < len(edges):
+                        next_edge[-1] = i + 1
+                        w = edges[i].tgt.id
+                        if not vtx_used[w]:
+                            vtx_used[w] = True
+                            vertices.append(w)
+                            next_edge.append(0)
+                            scores.append(scores[-1] + edges[i].score * esp**len(vertices))
+                            new_chain = True
+                    else:
+                        vtx_used[vertices.pop()] = False
+                        next_edge.pop()
+                        scores.pop()
+
+        if k > 0:
+            yield ChainBatch(ndd_index[:k], vtx_indices[:k], score[:k])
+
 def find_chains(digraph, ndds, max_chain, edge_success_prob=1):
     """Generate all chains with up to max_chain edges."""
 
-    def find_chains_recurse(vertices, score):
-        chains.append(Chain(ndd_idx, vertices[:], score))
-        if len(vertices) < max_chain:
-            for e in digraph.vs[vertices[-1]].edges:
-                if e.tgt.id not in vertices:
-                    vertices.append(e.tgt.id)
-                    find_chains_recurse(vertices, score+e.score*edge_success_prob**len(vertices))
-                    del vertices[-1]
-    chains = []
-    if max_chain == 0:
-        return chains
-    for ndd_idx, ndd in enumerate(ndds):
-        for e in ndd.edges:
-            vertices = [e.target_v.id]
-            find_chains_recurse(vertices, e.score*edge_success_prob)
-    return chains
-
+    return [batch.chain(i)
+            for batch in ChainStream(digraph, ndds, max_chain, edge_success_prob)
+            for i in range(len(batch))]
@@ -0,0 +1,182 @@
+"""Racing several formulations on one instance, and choosing formulations
+from the results of earlier races.
+
+Each formulation in a race is solved in its own worker process, with the time
+limit of the instance as a shared deadline. The first proven-optimal solution
+wins and the other workers are terminated. The instance and solutions cross
+process boundaries as plain lists rather than as Digraph objects.
+"""
+
+import collections
+import math
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+
+from gym_kidney._solver import kidney_cache
+from gym_kidney._solver import kidney_ip
+from gym_kidney._solver import kidney_solver
+from gym_kidney._solver.kidney_digraph import digraph_from_arrays
+from gym_kidney._solver.kidney_ndds import ndds_from_arrays
+from gym_kidney._solver.kidney_utils import KidneyOptimException
+
+# The formulations raced by default on each backend
+RACE_FORMULATIONS = {
+    "gurobi": ["picef", "cf", "hpief_prime"],
+    "highs": ["picef", "cf"],
+    "bnb": ["picef"]
+}
+
+# Seconds allowed after the deadline for workers to report
+GRACE = 5
+
+def instance_lists(cfg):
+    """Return the instance and parameters of an OptConfig as a dict of lists
+    and numbers."""
+    digraph, ndds = cfg.digraph, cfg.ndds
+    return {
+        "n": digraph.n,
+        "src": [e.src.id for e in digraph.es],
+        "tgt": [e.tgt.id for e in digraph.es],
+        "score": [e.score for e in digraph.es],
+        "ndd_count": len(ndds),
+        "ndd_src": [i for i, ndd in enumerate(ndds) for e in ndd.edges],
+        "ndd_tgt": [e.target_v.id for ndd in ndds for e in ndd.edges],
+        "ndd_score": [e.score for ndd in ndds for e in ndd.edges],
+        "max_cycle": cfg.max_cycle,
+        "max_chain": cfg.max_chain,
+        "timelimit": cfg.timelimit,
+        "edge_success_prob": cfg.edge_success_prob,
+        "chain_limit": cfg.chain_limit,
+        "gap": cfg.gap
+    }
+
+def config_from_lists(inst):
+    """Build an OptConfig from a dict made by instance_lists."""
+    digraph = digraph_from_arrays(inst["n"], inst["src"], inst["tgt"], inst["score"])
+    ndds = ndds_from_arrays(inst["ndd_count"], digraph,
+                            inst["ndd_src"], inst["ndd_tgt"], inst["ndd_score"])
+    return kidney_ip.OptConfig(digraph, ndds, inst["max_cycle"], inst["max_chain"],
+                               timelimit=inst["timelimit"],
+                               edge_success_prob=inst["edge_success_prob"],
+                               chain_limit=inst["chain_limit"],
+                               gap=inst["gap"])
+
+def race_worker(results, inst, formulation, backend, use_relabelled):
+    """Solve an instance with one formulation and put (formulation, solution,
+    (optimal, gap, nodes), error) on the results queue, where the solution is
+    as from kidney_cache.encode_solution with vertices and NDDs in their own
+    order."""
+    try:
+        cfg = config_from_lists(inst)
+        opt = kidney_solver.solve_kep(cfg, formulation, use_relabelled, backend)
+        entry = kidney_cache.encode_solution(opt, np.arange(inst["n"]),
+                                             np.arange(inst["ndd_count"]))
+        results.put((formulation, entry, (opt.optimal, opt.gap, opt.nodes), None))
+    except Exception as e:
+        results.put((formulation, None, None, repr(e)))
+
+def race(cfg, formulations, backend="gurobi", use_relabelled=True):
+    """Solve an instance with several formulations at once in worker processes.
+
+    If no formulation proves optimality by the time limit of cfg, the best
+    solution reported is returned.
+
+    Args:
+        cfg: an OptConfig object
+        formulations: a list of formulation names for solve_kep
+
+    Returns:
+        (opt, formulation), the OptSolution and the formulation that found it
+    """
+
+    inst = instance_lists(cfg)
+    identity = (np.arange(cfg.digraph.n), np.arange(len(cfg.ndds)))
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=race_worker,
+                                       args=(results, inst, f, backend, use_relabelled),
+                                       daemon=True)
+               for f in formulations]
+    for w in workers:
+        w.start()
+
+    end = None if cfg.timelimit is None else time.time() + cfg.timelimit + GRACE
+    best, winner, errors = None, None, []
+    try:
+        for __ in workers:
+            timeout = None if end is None else max(end - time.time(), 0)
+            try:
+                formulation, entry, status, error = results.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if error is not None:
+                errors.append("{}: {}".format(formulation, error))
+                continue
+            opt = kidney_cache.decode_solution(entry, cfg, *identity)
+            opt.optimal, opt.gap, opt.nodes = status
+            if best is None or opt.total_score > best.total_score:
+                best, winner = opt, formulation
+            if opt.optimal:
+                best, winner = opt, formulation
+                break
+    finally:
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+            w.join()
+
+    if best is None:
+        raise KidneyOptimException("No formulation finished: {}".format("; ".join(errors)))
+    return best, winner
+
+def instance_shape(cfg):
+    """The bin of an instance for choosing formulations: its caps, the bit
+    length of its number of vertices, the floor of the log2 of its edge
+    density, and whether it has NDDs."""
+    n = cfg.digraph.n
+    density = len(cfg.digraph.es) / (n * (n - 1)) if n > 1 else 0
+    return (cfg.max_cycle, cfg.max_chain, n.bit_length(),
+            math.floor(math.log2(density)) if density > 0 else None,
+            len(cfg.ndds) > 0)
+
+class FormulationChooser(object):
+    """Records the winners of races by instance shape, and chooses the
+    formulation that won most often on instances of the nearest shape.
+
+    Data members:
+        wins: a dict from each instance shape to a Counter of the wins of
+            each formulation
+        default: the formulation chosen when nothing has been recorded
+    """
+
+    def __init__(self, default="picef"):
+        self.wins = {}
+        self.default = default
+
+    def record(self, cfg, formulation):
+        """Record that formulation won a race on the instance of cfg."""
+        self.wins.setdefault(instance_shape(cfg), collections.Counter())[formulation] += 1
+
+    def choose(self, cfg, formulations):
+        """Choose a formulation among formulations for the instance of cfg."""
+        shape = instance_shape(cfg)
+
+        def distance(other):
+            if other[0:2] != shape[0:2] or other[4] != shape[4]:
+                return None
+            d = abs(other[2] - shape[2])
+            if (other[3] is None) != (shape[3] is None):
+                d += 2
+            elif other[3] is not None:
+                d += abs(other[3] - shape[3])
+            return d
+
+        candidates = [(distance(other), other) for other in self.wins]
+        candidates = [(d, other) for d, other in candidates if d is not None]
+        for d, other in sorted(candidates, key=lambda c: c[0]):
+            for formulation, __ in self.wins[other].most_common():
+                if formulation in formulations:
+                    return formulation
+        return self.default
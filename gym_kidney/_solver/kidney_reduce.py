@@ -0,0 +1,114 @@
+"""Removing the parts of a kidney-exchange instance that cannot be in any
+cycle or chain before building a model.
+
+An edge u -> v is on a cycle of at most max_cycle vertices if and only if
+there is a path from v to u of at most max_cycle - 1 edges. An edge can be in
+a chain if and only if its source is within max_chain - 1 edges of an NDD. The
+reduced instance keeps only such edges, the edges from NDDs if chains are
+allowed, and the vertices and NDDs they touch. Any solution of the reduced
+instance is a solution of the instance, and an optimal one is optimal.
+"""
+
+import copy
+
+import numpy as np
+import scipy.sparse
+from scipy.sparse import csgraph
+
+from gym_kidney._solver.kidney_digraph import digraph_from_arrays
+from gym_kidney._solver.kidney_ndds import ndds_from_arrays
+from gym_kidney._solver.kidney_components import chain_sources
+
+# The number of vertices searched from at once in cycle_edges
+BLOCK = 256
+
+def cycle_edges(n, src, tgt, max_cycle):
+    """Find whether each edge of a digraph with n vertices is on a cycle of
+    at most max_cycle vertices.
+
+    Only an edge within a strongly connected component can be on a cycle. For
+    those, a breadth-first search to depth max_cycle - 1 from each target, a
+    block of targets at a time, finds whether the source is near enough.
+    """
+
+    on_cycle = np.zeros(len(src), dtype=bool)
+    if max_cycle < 2 or len(src) == 0:
+        return on_cycle
+
+    adj = scipy.sparse.csr_matrix((np.ones(len(src)), (src, tgt)), shape=(n, n))
+    __, scc = csgraph.connected_components(adj, connection="strong")
+    cand = np.flatnonzero(scc[src] == scc[tgt])
+    cand = cand[np.argsort(tgt[cand], kind="stable")]
+    targets = np.unique(tgt[cand])
+
+    for i in range(0, len(targets), BLOCK):
+        block = targets[i:i + BLOCK]
+        dist = csgraph.dijkstra(adj, indices=block, unweighted=True,
+                                limit=max_cycle - 1)
+        lo, hi = np.searchsorted(tgt[cand], [block[0], block[-1] + 1])
+        edges = cand[lo:hi]
+        rows = np.searchsorted(block, tgt[edges])
+        on_cycle[edges] = dist[rows, src[edges]] <= max_cycle - 1
+    return on_cycle
+
+def reduce_instance(cfg):
+    """Remove the edges, vertices and NDDs of the instance of an OptConfig that
+    cannot be in any cycle or chain.
+
+    Returns:
+        (reduced, vtx_ids, ndd_ids, stats), where reduced is a copy of cfg with
+        the reduced instance, vertex i and NDD i of which are vertex vtx_ids[i]
+        and NDD ndd_ids[i] of the instance, and stats is a dict with the number
+        of vertices, edges, NDDs and NDD edges removed
+    """
+
+    digraph, ndds = cfg.digraph, cfg.ndds
+    n, k = digraph.n, len(ndds)
+    src = np.array([e.src.id for e in digraph.es], dtype=int)
+    tgt = np.array([e.tgt.id for e in digraph.es], dtype=int)
+    score = [e.score for e in digraph.es]
+    ndd_src = np.array([i for i, ndd in enumerate(ndds) for e in ndd.edges], dtype=int)
+    ndd_tgt = np.array([e.target_v.id for ndd in ndds for e in ndd.edges], dtype=int)
+    ndd_score = [e.score for ndd in ndds for e in ndd.edges]
+
+    keep = cycle_edges(n, src, tgt, cfg.max_cycle)
+    keep |= chain_sources(n, src, tgt, ndd_tgt, cfg.max_chain)[src]
+    keep_ndd = np.full(len(ndd_src), cfg.max_chain > 0)
+
+    used = np.zeros(n, dtype=bool)
+    used[src[keep]] = True
+    used[tgt[keep]] = True
+    used[ndd_tgt[keep_ndd]] = True
+    vtx_ids = np.flatnonzero(used)
+    ndd_used = np.zeros(k, dtype=bool)
+    ndd_used[ndd_src[keep_ndd]] = True
+    ndd_ids = np.flatnonzero(ndd_used)
+
+    vtx_label = np.cumsum(used) - 1
+    ndd_label = np.cumsum(ndd_used) - 1
+    kept = np.flatnonzero(keep).tolist()
+    kept_ndd = np.flatnonzero(keep_ndd).tolist()
+
+    reduced = copy.copy(cfg)
+    reduced.digraph = digraph_from_arrays(
+            len(vtx_ids),
+            vtx_label[src[kept]].tolist(),
+            vtx_label[tgt[kept]].tolist(),
+            [score[i] for i in kept])
+    reduced.ndds = ndds_from_arrays(
+            len(ndd_ids),
+            reduced.digraph,
+            ndd_label[ndd_src[kept_ndd]].tolist(),
+            vtx_label[ndd_tgt[kept_ndd]].tolist(),
+            [ndd_score[i] for i in kept_ndd])
+    if cfg.cycles is not None:
+        vs = reduced.digraph.vs
+        reduced.cycles = [[vs[vtx_label[v.id]] for v in c] for c in cfg.cycles]
+
+    stats = {
+        "vertices_removed": n - len(vtx_ids),
+        "edges_removed": len(src) - len(kept),
+        "ndds_removed": k - len(ndd_ids),
+        "ndd_edges_removed": len(ndd_src) - len(kept_ndd)
+    }
+    return reduced, vtx_ids, ndd_ids, stats
@@ -3,17 +3,26 @@ IP formulations for kidney exchange, including PICEF
 """
 
 import argparse
+import copy
 import time
 import sys
 
 from gym_kidney._solver import kidney_digraph
 from gym_kidney._solver import kidney_ip
+from gym_kidney._solver import kidney_highs
+from gym_kidney._solver import kidney_bnb
+from gym_kidney._solver import kidney_cache
+from gym_kidney._solver import kidney_components
+from gym_kidney._solver import kidney_reduce
+from gym_kidney._solver import kidney_race
 from gym_kidney._solver import kidney_utils
 from gym_kidney._solver import kidney_ndds
 
-def solve_kep(cfg, formulation, use_relabelled=True):
+def solve_kep(cfg, formulation, use_relabelled=True, backend="gurobi", cache=None,
+              decompose=False, workers=1, reduce=False, chooser=None,
+              race_formulations=None):
 
-    formulations = {
+    gurobi_formulations = {
         "uef":  ("Uncapped edge formulation", kidney_ip.optimise_uuef),
         "eef": ("EEF", kidney_ip.optimise_eef),
         "eef_full_red": ("EEF with full reduction by cycle generation", kidney_ip.optimise_eef_full_red),
@@ -25,19 +34,94 @@ def solve_kep(cfg, formulation, use_relabelled=True):
         "cf":   ("Cycle formulation",
                   kidney_ip.optimise_ccf)
     }
-    
-    if formulation in formulations:
+
+    # HiGHS (through SciPy) and branch and bound need no licence
+    highs_formulations = {
+        "picef": ("PICEF (HiGHS)", kidney_highs.optimise_picef),
+        "cf":   ("Cycle formulation (HiGHS)", kidney_highs.optimise_ccf)
+    }
+
+    bnb_formulations = {
+        "picef": ("Branch and bound", kidney_bnb.optimise_bnb),
+        "cf":   ("Branch and bound", kidney_bnb.optimise_bnb)
+    }
+
+    backends = {
+        "gurobi": gurobi_formulations,
+        "highs": highs_formulations,
+        "bnb": bnb_formulations
+    }
+
+    if backend not in backends:
+        raise ValueError("Unrecognised solver backend")
+    formulations = backends[backend]
+
+    # race solves with several formulations in worker processes, which
+    # relabel for themselves; auto picks the formulation that won races
+    # on instances like each one
+    relabel = use_relabelled
+    if formulation == "race":
+        names = race_formulations or kidney_race.RACE_FORMULATIONS[backend]
+        formulation_name = "Race of {}".format(", ".join(names))
+        relabel = False
+
+        def formulation_fun(sub_cfg):
+            opt_result, winner = kidney_race.race(sub_cfg, names, backend, use_relabelled)
+            if chooser is not None:
+                chooser.record(sub_cfg, winner)
+            return opt_result
+    elif formulation == "auto":
+        auto_chooser = chooser if chooser is not None else kidney_race.FormulationChooser()
+        formulation_name = "Automatic choice"
+
+        def formulation_fun(sub_cfg):
+            return formulations[auto_chooser.choose(sub_cfg, formulations)][1](sub_cfg)
+    elif formulation in formulations:
         formulation_name, formulation_fun = formulations[formulation]
-        if use_relabelled:
-            opt_result = kidney_ip.optimise_relabelled(formulation_fun, cfg)
-        else:
-            opt_result = formulation_fun(cfg)
-        kidney_utils.check_validity(opt_result, cfg.digraph, cfg.ndds, cfg.max_cycle, cfg.max_chain)
-        opt_result.formulation_name = formulation_name
-        return opt_result
     else:
         raise ValueError("Unrecognised IP formulation name")
 
+    # The time limit of cfg is a budget for the whole solve, so each part of a
+    # decomposed instance gets what is left of it
+    start_time = time.time()
+
+    def solve(sub_cfg):
+        if sub_cfg.timelimit is not None:
+            sub_cfg = copy.copy(sub_cfg)
+            sub_cfg.timelimit = max(cfg.timelimit - (time.time() - start_time), 0)
+        opt_result = None
+        if cache is not None:
+            key, dd_order, ndd_order = kidney_cache.fingerprint(sub_cfg)
+            entry = cache.get(key)
+            if entry is not None:
+                opt_result = kidney_cache.decode_solution(entry, sub_cfg, dd_order, ndd_order)
+        if opt_result is None:
+            if relabel:
+                opt_result = kidney_ip.optimise_relabelled(formulation_fun, sub_cfg)
+            else:
+                opt_result = formulation_fun(sub_cfg)
+            if cache is not None and opt_result.optimal:
+                cache.put(key, kidney_cache.encode_solution(opt_result, dd_order, ndd_order))
+        return opt_result
+
+    reduced = cfg
+    if reduce:
+        reduced, vtx_ids, ndd_ids, reduction_stats = kidney_reduce.reduce_instance(cfg)
+
+    # Each part of a decomposed instance is solved, and cached, on its own
+    if decompose:
+        opt_result = kidney_components.solve_components(reduced, solve, workers)
+    else:
+        opt_result = solve(reduced)
+
+    if reduce:
+        opt_result = kidney_components.join_solutions(cfg, [(vtx_ids, ndd_ids)], [opt_result])
+        opt_result.reduction_stats = reduction_stats
+    kidney_utils.check_validity(opt_result, cfg.digraph, cfg.ndds, cfg.max_cycle, cfg.max_chain)
+    opt_result.formulation_name = formulation_name
+    opt_result.solve_time = time.time() - start_time
+    return opt_result
+
 def start():
     parser = argparse.ArgumentParser("Solve a kidney-exchange instance")
     parser.add_argument("cycle_cap", type=int,
@@ -45,7 +129,8 @@ def start():
     parser.add_argument("chain_cap", type=int,
             help="The maximum permitted number of edges in a chain")
     parser.add_argument("formulation",
-            help="The IP formulation (uef, eef, eef_full_red, hpief_prime, hpief_2prime, hpief_prime_full_red, hpief_2prime_full_red, picef, cf)")
+            help="The IP formulation (uef, eef, eef_full_red, hpief_prime, hpief_2prime, hpief_prime_full_red, hpief_2prime_full_red, picef, cf), " +
+                 "or race to race several formulations, or auto to choose one")
     parser.add_argument("--use-relabelled", "-r", required=False,
             action="store_true",
             help="Relabel vertices in descending order of in-deg + out-deg")
@@ -55,6 +140,9 @@ def start():
     parser.add_argument("--timelimit", "-t", required=False, default=None,
             type=float,
             help="IP solver time limit in seconds (default: no time limit)")
+    parser.add_argument("--gap", "-g", required=False, default=0,
+            type=float,
+            help="Relative MIP gap at which the solver may stop (default: 0)")
     parser.add_argument("--verbose", "-v", required=False,
             action="store_true",
             help="Log Gurobi output to screen and log file")
@@ -68,6 +156,17 @@ def start():
     parser.add_argument("--relax", "-x", required=False,
             action='store_true',
             help="Solve the LP relaxation.")
+    parser.add_argument("--backend", "-b", required=False, default="gurobi",
+            choices=["gurobi", "highs", "bnb"],
+            help="The solver backend; highs and bnb support only picef and cf (default: gurobi)")
+    parser.add_argument("--decompose", "-d", required=False,
+            action="store_true",
+            help="Solve each independent part of the instance on its own")
+    parser.add_argument("--reduce", "-R", required=False,
+            action="store_true",
+            help="Remove vertices and edges in no cycle or chain before solving")
+    parser.add_argument("--workers", "-w", required=False, type=int, default=1,
+            help="The number of parts solved at once with --decompose (default: 1)")
             
     args = parser.parse_args()
     args.formulation = args.formulation.lower()
@@ -87,8 +186,10 @@ def start():
     start_time = time.time()
     cfg = kidney_ip.OptConfig(d, altruists, args.cycle_cap, args.chain_cap, args.verbose,
                               args.timelimit, args.edge_success_prob, args.eef_alt_constraints,
-                              args.lp_file, args.relax)
-    opt_solution = solve_kep(cfg, args.formulation, args.use_relabelled)
+                              args.lp_file, args.relax, gap=args.gap)
+    opt_solution = solve_kep(cfg, args.formulation, args.use_relabelled, args.backend,
+                             decompose=args.decompose, workers=args.workers,
+                             reduce=args.reduce)
     time_taken = time.time() - start_time
     print ("formulation: {}".format(args.formulation))
     print ("formulation_name: {}".format(opt_solution.formulation_name))
@@ -97,11 +198,20 @@ def start():
     print ("chain_cap: {}".format(args.chain_cap))
     print ("edge_success_prob: {}".format(args.edge_success_prob))
     print ("ip_time_limit: {}".format(args.timelimit))
-    print ("ip_vars: {}".format(opt_solution.ip_model.numVars))
-    print ("ip_constrs: {}".format(opt_solution.ip_model.numConstrs))
+    print ("backend: {}".format(args.backend))
+    if args.reduce:
+        for key, value in sorted(opt_solution.reduction_stats.items()):
+            print ("{}: {}".format(key, value))
+    if opt_solution.ip_model is not None:
+        print ("ip_vars: {}".format(opt_solution.ip_model.numVars))
+        print ("ip_constrs: {}".format(opt_solution.ip_model.numConstrs))
     print ("total_time: {}".format(time_taken))
-    print ("ip_solve_time: {}".format(opt_solution.ip_model.runtime))
-    print ("solver_status: {}".format(opt_solution.ip_model.status))
+    if opt_solution.ip_model is not None:
+        print ("ip_solve_time: {}".format(opt_solution.ip_model.runtime))
+        print ("solver_status: {}".format(opt_solution.ip_model.status))
+    print ("optimal: {}".format(opt_solution.optimal))
+    print ("gap: {}".format(opt_solution.gap))
+    print ("nodes: {}".format(opt_solution.nodes))
     print ("total_score: {}".format(opt_solution.total_score))
     opt_solution.display()
 
@@ -1,3 +1,6 @@
 from gym_kidney.actions.action import *
 from gym_kidney.actions.flap import *
 from gym_kidney.actions.blood import *
+from gym_kidney.actions.approx import *
+from gym_kidney.actions.greedy import *
+from gym_kidney.actions.lp import *
@@ -1,7 +1,10 @@
 from gym import spaces
 from gym_kidney import _solver
+from gym_kidney import pools
 
-import networkx as nx
+import numpy as np
+
+BLOODS = pools.BLOODS
 
 #
 # Action is an abstract class defining the possible actions an
@@ -21,75 +24,151 @@ class Action:
 	# The action space of the gym
 	action_space = spaces.Discrete(2)
 
-	# do_action : Graph -> (Graph, Float)
-	# Performs action on the graph returning new graph and reward
+	# cache : SolutionCache
+	# The cache of solutions shared by solves, or None
+	cache = None
+
+	# decompose : Bool
+	# Whether to solve each independent part of the pool on its own
+	decompose = False
+
+	# reduce : Bool
+	# Whether to remove vertices and edges in no cycle or chain first
+	reduce = False
+
+	# formulation : String
+	# The formulation solved, or race or auto
+	formulation = "picef"
+
+	# chooser : FormulationChooser
+	# Records race winners and chooses formulations for auto, or None
+	chooser = None
+
+	# timelimit : Real
+	# Seconds the solver may take per match, or None for no limit
+	timelimit = None
+
+	# gap : Real
+	# Relative gap at which the solver may stop
+	gap = 0
+
+	# do_action : Pool, Action -> (Pool, Float)
+	# Performs action on the pool returning new pool and reward
 	def do_action(G, action):
 		raise NotImplementedError
 
-	# _relabel : Graph -> (Nat, Nat, Dict, Dict)
-	# Returns counts of DD's and NDD's and relabeling dictionaries
+	# _relabel : Pool -> ([Nat], [Nat], [Nat])
+	# Returns the slots of DD's and of NDD's, and the index of every
+	# slot among the DD's or NDD's
 	def _relabel(self, G):
-		n_dd, n_ndd = 0, 0
-		d_dd, d_ndd = {}, {}
-
-		for u in G.nodes():
-			if G.node[u]["ndd"]:
-				d_ndd[u] = n_ndd
-				n_ndd += 1
-			else:
-				d_dd[u] = n_dd
-				n_dd += 1
-
-		return n_dd, n_ndd, d_dd, d_ndd
-
-	# _inv_dict : Dict -> Dict
-	# Inverts dictionary
-	def _inv_dict(self, d):
-		return dict((v, k) for k, v in d.items())
-
-	# _process_matches : Graph, Matching -> Graph
-	# Extracts matches and repairs graph
+		ndd = G.ndd
+		dd_slots, ndd_slots = np.flatnonzero(~ndd), np.flatnonzero(ndd)
+		label = np.empty(G.order(), dtype = int)
+		label[dd_slots] = np.arange(len(dd_slots))
+		label[ndd_slots] = np.arange(len(ndd_slots))
+		return dd_slots, ndd_slots, label
+
+	# _process_matches : Pool, Matching -> Pool
+	# Extracts matches and repairs pool
 	def _process_matches(self, G, M):
 		if len(M) == 0:
 			return G
 
-		_, _, d_dd, d_ndd = self._relabel(G)
-		d_dd, d_ndd = self._inv_dict(d_dd), self._inv_dict(d_ndd)
+		dd_slots, ndd_slots, _ = self._relabel(G)
 		cycle, chain = M
-		out = []
+		out = [np.arange(0)]
 
 		for vs in cycle:
-			out += list(map(lambda u: d_dd[u.id], vs))
+			out.append(dd_slots[[u.id for u in vs]])
 		for c in chain:
-			vs = c.vtx_indices
-			out += [d_ndd[c.ndd_index]]
-			out += list(map(lambda u: d_dd[u], vs))
-		for v in out:
-			self.stats["%s_patient_matched" % G.node[v]["bp"]] += 1
-			self.stats["%s_donor_matched" % G.node[v]["bd"]] += 1
-
-		G.remove_nodes_from(out)
-		return nx.convert_node_labels_to_integers(G)
-
-	# _nx_to_ks : Graph -> (Digraph, [NDD])
-	# Converts NetworkX graph to kidney solver representation
-	def _nx_to_ks(self, G):
-		n_dd, n_ndd, d_dd, d_ndd = self._relabel(G)
-
-		dd = _solver.Digraph(n_dd)
-		for u, v, d in G.edges(data = True):
-			if not G.node[u]["ndd"]:
-				dd.add_edge(
-					d["weight"] if ("weight" in d) else 1.0,
-					dd.vs[d_dd[u]],
-					dd.vs[d_dd[v]])
-
-		ndds = [_solver.kidney_ndds.Ndd() for _ in range(n_ndd)]
-		for u, v, d in G.edges(data = True):
-			if G.node[u]["ndd"]:
-				edge = _solver.kidney_ndds.NddEdge(
-					dd.vs[d_dd[v]],
-					d["weight"] if ("weight" in d) else 1.0)
-				ndds[d_ndd[u]].add_edge(edge)
-		
+			out.append(ndd_slots[[c.ndd_index]])
+			out.append(dd_slots[c.vtx_indices])
+
+		return self._remove_matched(G, np.concatenate(out))
+
+	# _remove_matched : Pool, [Nat] -> Pool
+	# Records the blood types of matched vertices and removes them
+	def _remove_matched(self, G, out):
+		out = np.asarray(out, dtype = int)
+		for col, key in [(G.bp, "%s_patient_matched"), (G.bd, "%s_donor_matched")]:
+			codes = col[out]
+			counts = np.bincount(codes[codes >= 0], minlength = len(BLOODS))
+			for code in np.flatnonzero(counts).tolist():
+				self.stats[key % BLOODS[code]] += int(counts[code])
+
+		G.remove_vertices(out)
+		return G
+
+	# _pool_to_ks : Pool -> (Digraph, [NDD])
+	# Converts pool to kidney solver representation, relabelling the
+	# edge arrays of the pool directly. Edges into an NDD are dropped,
+	# since an altruist never receives a kidney
+	def _pool_to_ks(self, G):
+		dd_slots, ndd_slots, label = self._relabel(G)
+		src, tgt = G.edges()
+		weight = G.weights(src, tgt)
+		keep = ~G.ndd[tgt]
+		src, tgt, weight = src[keep], tgt[keep], weight[keep]
+		from_ndd = G.ndd[src]
+		from_dd = ~from_ndd
+
+		dd = _solver.digraph_from_arrays(
+			len(dd_slots),
+			label[src[from_dd]].tolist(),
+			label[tgt[from_dd]].tolist(),
+			weight[from_dd].tolist())
+		ndds = _solver.kidney_ndds.ndds_from_arrays(
+			len(ndd_slots),
+			dd,
+			label[src[from_ndd]].tolist(),
+			label[tgt[from_ndd]].tolist(),
+			weight[from_ndd].tolist())
+
 		return dd, ndds
+
+	# _solve : OptConfig -> OptSolution
+	# Solves with the formulation and backend of the action, looking
+	# instances up in the solution cache first if there is one
+	def _solve(self, cfg):
+		cache = self.cache
+		if cache is not None:
+			hits, misses = cache.hits, cache.misses
+
+		soln = _solver.solve_kep(cfg, self.formulation, backend = self.backend,
+			cache = cache, decompose = self.decompose, reduce = self.reduce,
+			chooser = self.chooser)
+
+		if cache is not None:
+			self.stats["cache_hits"] += cache.hits - hits
+			self.stats["cache_misses"] += cache.misses - misses
+		if self.reduce:
+			for key, value in soln.reduction_stats.items():
+				self.stats[key] += value
+		self._record_solve(soln.solve_time, soln.gap, soln.nodes, soln.optimal)
+		return soln
+
+	# _record_solve : Real, Real, Nat, Bool -> Void
+	# Records the time, gap, node count and status of a solve, which is
+	# suboptimal when the budget ran out before optimality was proven
+	def _record_solve(self, time, gap, nodes, optimal):
+		self.stats["solve_time"] += time
+		self.stats["solve_time_max"] = max(self.stats["solve_time_max"], time)
+		self.stats["solve_nodes"] += nodes
+		self.stats["solve_gap_max"] = max(self.stats["solve_gap_max"], gap)
+		self.stats["solve_suboptimal"] += int(not optimal)
+
+	# _pool_cycles : Pool, Digraph, Nat -> [[Vertex]]
+	# Cycles of the pool as vertices of the digraph from _pool_to_ks,
+	# updating the cycle index kept for the pool in _cycle_indices
+	def _pool_cycles(self, G, dd, max_cycle):
+		index = self._cycle_indices.get(G)
+		if index is None:
+			index = _solver.kidney_cycle_index.CycleIndex(max_cycle)
+			self._cycle_indices[G] = index
+
+		src, tgt = G.edges()
+		index.update(G.uid, G.ndd, src, tgt)
+
+		_, _, label = self._relabel(G)
+		return [[dd.vs[u] for u in label[c].tolist()]
+			for c in index.slot_cycles(G.uid)]
@@ -0,0 +1,103 @@
+from gym import spaces
+from gym_kidney import actions
+from gym_kidney import _solver
+
+BLOODS = ["A", "B", "AB", "O", "-"]
+
+#
+# ApproxAction is an abstract class for actions that match like
+# FlapAction, but with a fast heuristic instead of an exact solver.
+# Now and then it also solves exactly to sample the optimality gap.
+# - cycle_cap : Nat, the cycle cap for the solver
+# - chain_cap : Nat, the chain cap for the solver
+# - passes : Nat, rounds of local search after the heuristic
+# - sample_every : Nat, solve exactly on every this many matches to
+#   record the gap, or 0 to never
+# - backend : String, solver backend for the exact samples
+# - timelimit : Real, seconds the heuristic, and each exact sample, may
+#   take per match before the best solution found is used, or None for
+#   no limit
+#
+class ApproxAction(actions.Action):
+
+	action_space = spaces.Discrete(2)
+
+	def __init__(self, cycle_cap, chain_cap, passes = 1, sample_every = 0,
+		backend = "gurobi", timelimit = None):
+		self.cycle_cap = cycle_cap
+		self.chain_cap = chain_cap
+		self.passes = passes
+		self.sample_every = sample_every
+		self.backend = backend
+		self.timelimit = timelimit
+		self._matches = 0
+
+		self.params = {
+			"cycle_cap": cycle_cap,
+			"chain_cap": chain_cap,
+			"passes": passes,
+			"sample_every": sample_every,
+			"backend": backend,
+			"timelimit": timelimit
+		}
+
+		self.stats = {
+			"cycle_reward": 0,
+			"chain_reward": 0,
+			"sampled": 0,
+			"sampled_score": 0,
+			"sampled_opt_score": 0,
+			"sampled_gap_mean": 0,
+			"sampled_gap_max": 0
+		}
+
+		for blood in BLOODS:
+			self.stats["%s_patient_matched" % blood] = 0
+			self.stats["%s_donor_matched" % blood] = 0
+
+	def do_action(self, G, action):
+		if action == 0:
+			return (G, 0)
+
+		dd, ndd = self._pool_to_ks(G)
+		cfg = _solver.kidney_ip.OptConfig(
+			dd,
+			ndd,
+			self.cycle_cap,
+			self.chain_cap,
+			timelimit = self.timelimit)
+		soln = self._optimise(cfg)
+
+		self._matches += 1
+		if self.sample_every > 0 and self._matches % self.sample_every == 0:
+			opt = _solver.solve_kep(cfg, "picef", backend = self.backend)
+			self._record_sample(soln.total_score, opt.total_score)
+
+		M = (soln.cycles, soln.chains)
+		G = self._process_matches(G, M)
+
+		rew_cycles = sum(map(lambda x: len(x), soln.cycles))
+		rew_chains = sum(map(lambda x: len(x.vtx_indices), soln.chains))
+		reward = rew_cycles + rew_chains
+
+		self.stats["cycle_reward"] += rew_cycles
+		self.stats["chain_reward"] += rew_chains
+
+		return (G, reward)
+
+	# _record_sample : Real, Real -> Void
+	# Records the score of a sampled match against the optimal score,
+	# with the gap of the sample in its running mean and max
+	def _record_sample(self, score, opt_score):
+		gap = 1 - score / opt_score if opt_score > 0 else 0
+		self.stats["sampled"] += 1
+		self.stats["sampled_score"] += score
+		self.stats["sampled_opt_score"] += opt_score
+		self.stats["sampled_gap_mean"] += \
+			(gap - self.stats["sampled_gap_mean"]) / self.stats["sampled"]
+		self.stats["sampled_gap_max"] = max(self.stats["sampled_gap_max"], gap)
+
+	# _optimise : OptConfig -> OptSolution
+	# Finds a good solution quickly
+	def _optimise(self, cfg):
+		raise NotImplementedError
@@ -2,6 +2,9 @@ from gym import spaces
 from gym_kidney import actions
 from gym_kidney import _solver
 
+import numpy as np
+import weakref
+
 BLOODS = {
 	"A": 0,
 	"B": 1,
@@ -18,12 +21,40 @@ BLOODS = {
 # - min : Real, smallest value for vertex
 # - max : Real, largest value for vertex
 # - w_fun : (Real, Real -> Real), weight function
+# - backend : String, solver backend (gurobi, highs or bnb)
+# - incremental : Bool, keep the cycles of each pool between ticks
+# - cache : SolutionCache, cache of solutions to look pools up in
+#   before solving, or None
+# - decompose : Bool, solve each independent part of the pool on its own
+# - reduce : Bool, remove vertices and edges in no cycle or chain
+#   before solving
+# - formulation : String, formulation for the solver, or race or auto
+# - chooser : FormulationChooser, records race winners for auto, or
+#   None for a new one
+# - timelimit : Real, seconds the solver may take per match before
+#   the best solution found is used, or None for no limit
+# - gap : Real, relative gap at which the solver may stop
 #
 class BloodAction(actions.Action):
 
-	def __init__(self, cycle_cap, chain_cap, min, max, w_fun):
+	def __init__(self, cycle_cap, chain_cap, min, max, w_fun,
+		backend = "gurobi", incremental = False, cache = None, decompose = False,
+		reduce = False, formulation = "picef", chooser = None,
+		timelimit = None, gap = 0):
 		self.cycle_cap = cycle_cap
 		self.chain_cap = chain_cap
+		self.backend = backend
+		self.incremental = incremental
+		self.cache = cache
+		self.decompose = decompose
+		self.reduce = reduce
+		self.formulation = formulation
+		self.chooser = chooser
+		self.timelimit = timelimit
+		self.gap = gap
+		if chooser is None:
+			self.chooser = _solver.kidney_race.FormulationChooser()
+		self._cycle_indices = weakref.WeakKeyDictionary()
 		self.min = min
 		self.max = max
 		self.w_fun = w_fun
@@ -33,7 +64,15 @@ class BloodAction(actions.Action):
 			"cycle_cap": cycle_cap,
 			"chain_cap": chain_cap,
 			"min": min,
-			"max": max
+			"max": max,
+			"backend": backend,
+			"incremental": incremental,
+			"cache": cache is not None,
+			"decompose": decompose,
+			"reduce": reduce,
+			"formulation": formulation,
+			"timelimit": timelimit,
+			"gap": gap
 		}
 
 		self.stats = {
@@ -41,18 +80,33 @@ class BloodAction(actions.Action):
 			"chain_reward": 0
 		}
 
+		for key in ["time", "time_max", "nodes", "gap_max", "suboptimal"]:
+			self.stats["solve_%s" % key] = 0
+
+		if cache is not None:
+			self.stats["cache_hits"] = 0
+			self.stats["cache_misses"] = 0
+
+		if reduce:
+			for key in ["vertices", "edges", "ndds", "ndd_edges"]:
+				self.stats["%s_removed" % key] = 0
+
 		for blood in BLOODS:
 			self.stats["%s_patient_matched" % blood] = 0
 			self.stats["%s_donor_matched" % blood] = 0
 
 	def do_action(self, G, action):
-		dd, ndd = self._nx_to_ks(G)
+		dd, ndd = self._pool_to_ks(G)
 		cfg = _solver.kidney_ip.OptConfig(
 			dd,
 			ndd,
 			self.cycle_cap,
-			self.chain_cap)
-		soln = _solver.solve_kep(cfg, "picef")
+			self.chain_cap,
+			timelimit = self.timelimit,
+			gap = self.gap)
+		if self.incremental:
+			cfg.cycles = self._pool_cycles(G, dd, self.cycle_cap)
+		soln = self._solve(cfg)
 		M = (soln.cycles, soln.chains)
 		G = self._reweight(G, action)
 		G = self._process_matches(G, M)
@@ -67,13 +121,22 @@ class BloodAction(actions.Action):
 		return (G, reward)
 
 	def _reweight(self, G, action):
-		for u, v, d in G.edges(data = True):
-			o1 = self._vertex_weight(G, u, action)
-			o2 = self._vertex_weight(G, v, action)
-			d["weight"] = self.w_fun(o1, o2)
-			#d["weight"] = 1 - 0.5*(o1+o2)
-		return G 
+		n = len(BLOODS)
+		src, tgt = G.edges()
+		bd, bp = G.bd.astype(int), G.bp.astype(int)
+
+		# every endpoint needs both blood types to index the action
+		ends = np.union1d(src, tgt)
+		bad = ends[(bd[ends] < 0) | (bd[ends] >= n) | (bp[ends] < 0) | (bp[ends] >= n)]
+		if len(bad) > 0:
+			raise ValueError("BloodAction needs the blood types of every vertex; "
+				"vertex %d has donor type %d and patient type %d"
+				% (G.uid[bad[0]], bd[bad[0]], bp[bad[0]]))
+		c = bd * n + bp
 
-	def _vertex_weight(self, G, u, action):
-		bd, bp = G.node[u]["bd"], G.node[u]["bp"]
-		return action[BLOODS[bd]*len(BLOODS) + BLOODS[bp]]
+		# weights only depend on the blood types of both endpoints
+		pairs, inv = np.unique(c[src] * n**2 + c[tgt], return_inverse = True)
+		ws = [self.w_fun(action[p // n**2], action[p % n**2]) for p in pairs]
+
+		G.set_weights(src, tgt, np.array(ws, dtype = "f")[inv])
+		return G 
@@ -2,6 +2,9 @@ from gym import spaces
 from gym_kidney import actions
 from gym_kidney import _solver
 
+import numpy as np
+import weakref
+
 BLOODS = ["A", "B", "AB", "O", "-"]
 
 #
@@ -9,18 +12,57 @@ BLOODS = ["A", "B", "AB", "O", "-"]
 # the graph.
 # - cycle_cap : Nat, the cycle cap for the solver
 # - chain_cap : Nat, the chain cap for the solver
+# - backend : String, solver backend (gurobi, highs or bnb)
+# - incremental : Bool, keep a PICEF model per pool between ticks
+#   (gurobi or highs backend)
+# - cache : SolutionCache, cache of solutions to look pools up in
+#   before solving, or None (not used with incremental)
+# - decompose : Bool, solve each independent part of the pool on its
+#   own (not used with incremental)
+# - reduce : Bool, remove vertices and edges in no cycle or chain
+#   before solving (not used with incremental)
+# - formulation : String, formulation for the solver, or race or auto
+#   (not used with incremental)
+# - chooser : FormulationChooser, records race winners for auto, or
+#   None for a new one
+# - timelimit : Real, seconds the solver may take per match before
+#   the best solution found is used, or None for no limit
+# - gap : Real, relative gap at which the solver may stop
 #
 class FlapAction(actions.Action):
 
 	action_space = spaces.Discrete(2)
 
-	def __init__(self, cycle_cap, chain_cap):
+	def __init__(self, cycle_cap, chain_cap, backend = "gurobi",
+		incremental = False, cache = None, decompose = False,
+		reduce = False, formulation = "picef", chooser = None,
+		timelimit = None, gap = 0):
 		self.cycle_cap = cycle_cap
 		self.chain_cap = chain_cap
+		self.backend = backend
+		self.incremental = incremental
+		self.cache = cache
+		self.decompose = decompose
+		self.reduce = reduce
+		self.formulation = formulation
+		self.chooser = chooser
+		self.timelimit = timelimit
+		self.gap = gap
+		if chooser is None:
+			self.chooser = _solver.kidney_race.FormulationChooser()
+		self._engines = weakref.WeakKeyDictionary()
 
 		self.params = {
 			"cycle_cap": cycle_cap,
-			"chain_cap": chain_cap
+			"chain_cap": chain_cap,
+			"backend": backend,
+			"incremental": incremental,
+			"cache": cache is not None,
+			"decompose": decompose,
+			"reduce": reduce,
+			"formulation": formulation,
+			"timelimit": timelimit,
+			"gap": gap
 		}
 
 		self.stats = {
@@ -28,6 +70,17 @@ class FlapAction(actions.Action):
 			"chain_reward": 0
 		}
 
+		for key in ["time", "time_max", "nodes", "gap_max", "suboptimal"]:
+			self.stats["solve_%s" % key] = 0
+
+		if cache is not None:
+			self.stats["cache_hits"] = 0
+			self.stats["cache_misses"] = 0
+
+		if reduce:
+			for key in ["vertices", "edges", "ndds", "ndd_edges"]:
+				self.stats["%s_removed" % key] = 0
+
 		for blood in BLOODS:
 			self.stats["%s_patient_matched" % blood] = 0
 			self.stats["%s_donor_matched" % blood] = 0
@@ -36,13 +89,18 @@ class FlapAction(actions.Action):
 		if action == 0:
 			return (G, 0)
 
-		dd, ndd = self._nx_to_ks(G)
+		if self.incremental:
+			return self._do_incremental(G)
+
+		dd, ndd = self._pool_to_ks(G)
 		cfg = _solver.kidney_ip.OptConfig(
 			dd,
 			ndd,
 			self.cycle_cap,
-			self.chain_cap)
-		soln = _solver.solve_kep(cfg, "picef")
+			self.chain_cap,
+			timelimit = self.timelimit,
+			gap = self.gap)
+		soln = self._solve(cfg)
 		M = (soln.cycles, soln.chains)
 		G = self._process_matches(G, M)
 
@@ -54,3 +112,37 @@ class FlapAction(actions.Action):
 		self.stats["chain_reward"] += rew_chains
 
 		return (G, reward)
+
+	# _do_incremental : Pool -> (Pool, Float)
+	# Matches with the PICEF model kept for the pool, which only
+	# changes where the pool changed since the last match
+	def _do_incremental(self, G):
+		engine = self._engines.get(G)
+		if engine is None:
+			engine = _solver.kidney_incremental.IncrementalPicef(
+				self.cycle_cap,
+				self.chain_cap,
+				timelimit = self.timelimit,
+				backend = self.backend,
+				gap = self.gap)
+			self._engines[G] = engine
+
+		src, tgt = G.edges()
+		cycles, chains = engine.solve(G.uid, G.ndd, src, tgt,
+			G.weights(src, tgt))
+		self._record_solve(engine.solve_time, engine.last_gap,
+			engine.nodes, engine.optimal)
+
+		rew_cycles = sum(map(len, cycles))
+		rew_chains = sum(map(lambda x: len(x[1]), chains))
+		reward = rew_cycles + rew_chains
+
+		self.stats["cycle_reward"] += rew_cycles
+		self.stats["chain_reward"] += rew_chains
+
+		out = [np.arange(0)] + cycles
+		for ndd, vs in chains:
+			out += [[ndd], vs]
+		G = self._remove_matched(G, np.concatenate(out).astype(int))
+
+		return (G, reward)
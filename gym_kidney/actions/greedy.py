@@ -0,0 +1,20 @@
+from gym_kidney import actions
+from gym_kidney import _solver
+
+#
+# GreedyAction packs disjoint cycles and chains greedily by score,
+# then improves the packing by local search.
+# - cycle_cap : Nat, the cycle cap for the solver
+# - chain_cap : Nat, the chain cap for the solver
+# - passes : Nat, rounds of local search after packing
+# - sample_every : Nat, solve exactly on every this many matches to
+#   record the gap, or 0 to never
+# - backend : String, solver backend for the exact samples
+# - timelimit : Real, seconds the heuristic, and each exact sample, may
+#   take per match before the best solution found is used, or None for
+#   no limit
+#
+class GreedyAction(actions.ApproxAction):
+
+	def _optimise(self, cfg):
+		return _solver.kidney_heuristic.optimise_greedy(cfg, self.passes)
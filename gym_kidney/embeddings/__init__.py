@@ -1,6 +1,7 @@
 from gym_kidney.embeddings.embedding import *
 from gym_kidney.embeddings.chain import *
 from gym_kidney.embeddings.omniscient import *
+from gym_kidney.embeddings.cycle_count import *
 from gym_kidney.embeddings.cycle_fixed import *
 from gym_kidney.embeddings.cycle_variable import *
 from gym_kidney.embeddings.dd import *
@@ -2,7 +2,6 @@ from gym_kidney import embeddings
 from gym import spaces
 
 import numpy as np
-import networkx as nx
 
 #
 # ChainEmbedding embeds the sum of longest chains possible from
@@ -19,11 +18,21 @@ class ChainEmbedding(embeddings.Embedding):
 	def embed(self, G, rng):
 		len = 0
 
-		for u in G.nodes_iter():
-			if G.node[u]["ndd"]:
-				len += self._longest_path(G, u)
+		for u in np.flatnonzero(G.ndd):
+			len += self._longest_path(G, u)
 
 		return np.array([len], dtype = "f")
 
 	def _longest_path(self, G, u):
-		return len(nx.dag_longest_path(nx.bfs_tree(G, u)))
+		# vertices on the longest path of the BFS tree rooted at u
+		adj = G.adj
+		seen = np.zeros(G.order(), dtype = bool)
+		seen[u] = True
+		frontier, depth = seen.copy(), 1
+
+		while True:
+			frontier = adj[frontier].any(axis = 0) & ~seen
+			if not frontier.any():
+				return depth
+			seen |= frontier
+			depth += 1
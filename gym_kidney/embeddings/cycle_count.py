@@ -0,0 +1,54 @@
+from gym_kidney import embeddings
+from gym_kidney import _solver
+from gym import spaces
+
+import numpy as np
+import weakref
+
+#
+# CycleCountEmbedding embeds the exact number of cycles of every length
+# from 2 to max_length, found by the bounded cycle enumerator of the
+# solver. Only edges between pairs count, as no cycle runs through an
+# NDD.
+# - max_length : Nat, longest cycle length under consideration
+# - incremental : Bool, keep a cycle index per pool between ticks
+#
+class CycleCountEmbedding(embeddings.Embedding):
+
+	def __init__(self, max_length, incremental = False):
+		self.max_length = max_length
+		self.incremental = incremental
+		self._cycle_indices = weakref.WeakKeyDictionary()
+
+		self.params = {
+			"max_length": max_length,
+			"incremental": incremental
+		}
+
+		size = max(max_length - 1, 0)
+		self.observation_space = spaces.Box(0, np.inf, (size,))
+
+	def embed(self, G, rng):
+		src, tgt = G.edges()
+		if self.incremental:
+			counts = self._index_counts(G, src, tgt)
+		else:
+			pair = ~G.ndd[src] & ~G.ndd[tgt]
+			cycles = _solver.kidney_cycles.packed_cycles(G.order(),
+				src[pair], tgt[pair], self.max_length)
+			lengths = _solver.kidney_cycles.cycle_lengths(cycles)
+			counts = np.bincount(lengths, minlength = self.max_length + 1)
+
+		return np.array(counts[2:self.max_length + 1], dtype = "f")
+
+	# _index_counts : Pool, [Nat], [Nat] -> [Nat]
+	# Counts of cycles by length from the cycle index kept for the
+	# pool, which only enumerates cycles through changed vertices
+	def _index_counts(self, G, src, tgt):
+		index = self._cycle_indices.get(G)
+		if index is None:
+			index = _solver.kidney_cycle_index.CycleIndex(self.max_length)
+			self._cycle_indices[G] = index
+
+		index.update(G.uid, G.ndd, src, tgt)
+		return index.counts
@@ -1,9 +1,23 @@
 from gym_kidney import embeddings
 from gym import spaces
 
+import itertools
 import numpy as np
 import scipy.special as sp
-import networkx as nx
+
+# _spanning_cycle : Matrix, [Nat] -> Bool
+# Whether the distinct vertices us lie on one cycle through all of them
+def _spanning_cycle(adj, us):
+	n = len(us)
+	if len(np.unique(us)) < n:
+		return False
+
+	A = adj[np.ix_(us, us)]
+	for perm in itertools.permutations(range(1, n)):
+		c = (0,) + perm
+		if all(A[c[i - 1], c[i]] for i in range(n)):
+			return True
+	return False
 
 #
 # CycleFixedEmbedding embeds an estimate for the number of cycles in the graph
@@ -27,13 +41,10 @@ class CycleFixedEmbedding(embeddings.Embedding):
 		max_cycle = sp.binom(G.order(), self.cycle_length)
 
 		for _ in range(self.sample_size):
-			us = rng.choice(G.nodes(), self.cycle_length)
-			H = G.subgraph(us.tolist())
+			us = rng.choice(G.order(), self.cycle_length)
 
-			for c in nx.simple_cycles(H):
-				if len(c) == self.cycle_length:
-					succ += 1
-					break
+			if _spanning_cycle(G.adj, us):
+				succ += 1
 
 		val = [max_cycle * (succ / self.sample_size)]
 		return np.array(val, dtype = "f")
@@ -3,7 +3,8 @@ from gym import spaces
 
 import numpy as np
 import scipy.special as sp
-import networkx as nx
+
+from gym_kidney.embeddings.cycle_fixed import _spanning_cycle
 
 #
 # CycleVariableEmbedding embeds an estimate for the number of cycles in the
@@ -29,14 +30,11 @@ class CycleVariableEmbedding(embeddings.Embedding):
 		max_cycle = sp.binom(G.order(), self.cycle_length)
 
 		for _ in range(self.sample_cap):
-			us = rng.choice(G.nodes(), self.cycle_length)
-			H = G.subgraph(us.tolist())
+			us = rng.choice(G.order(), self.cycle_length)
 			samples += 1
 
-			for c in nx.simple_cycles(H):
-				if len(c) == self.cycle_length:
-					succ += 1
-					break
+			if _spanning_cycle(G.adj, us):
+				succ += 1
 			if succ >= self.successes:
 				break
 			
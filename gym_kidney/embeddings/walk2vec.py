@@ -2,75 +2,89 @@ from gym_kidney import embeddings
 from gym import spaces
 
 import math
-import networkx as nx
 import numpy as np
 import scipy.sparse as sp
-# import spams
 
 #
 # MAIN FUNCTIONS
 #
 
-def _alpha(g, alpha):
+def _walks(w, p0, tau, alpha):
 	"""
-	Given graph g and vertex v. Returns Dirac
-	delta distribution at vertex v.
+	Given transition matrix w, n x k matrix p0 of initial
+	distributions, jump probability alpha, and walk cap tau.
+	Returns (tau+1) x n x k array ps, where ps[t] holds the
+	distributions over vertices after t steps.
 	"""
-	n = g.order()
-	v = [alpha / float(n)] * n
-	return sp.csc_matrix(v).T
+	n, k = p0.shape
+	ps = np.empty((tau+1, n, k))
+	ps[0] = p0
+	for i in range(1, tau+1):
+		ps[i] = w.dot(ps[i-1])
+		ps[i] *= 1.0-alpha
+		ps[i] += alpha / float(n)
+	return ps
 
-def _walks(g, w, p0, tau, alpha):
+def _trans_data(n, src, tgt, weight):
 	"""
-	Given graph g, transition matrix w, initial distribution
-	p0, jump probability alpha, and walk cap tau. Returns
-	list ps, where ps[t] is the distribution over vertices
-	after t steps.
+	Given order n and edges src[i] -> tgt[i] with weights.
+	Returns the entry of the transition matrix for every
+	edge, its weight over the degree of its source.
 	"""
-	ps = [p0]
-	n = g.order()
-	for i in range(1, tau+1):
-		ps += [_alpha(g, alpha) + (1.0-alpha)*w*ps[i-1]]
-	return ps
+	degs = np.bincount(src, minlength = n) + np.bincount(tgt, minlength = n)
+	return weight / degs[src]
 
-def _degrees_inv(g):
+def _trans_matrix(n, src, tgt, data):
 	"""
-	Given graph g. Returns inverse of degree matrix
-	where 0 entries are ignored.
+	Given order n, edges src[i] -> tgt[i], and their entries.
+	Returns the transition matrix.
 	"""
-	n, degs = g.order(), g.degree().values()
-	degs = list(map(lambda x : 0 if x == 0 else 1.0/float(x), degs))
-	return sp.diags(degs, format = "csc")
+	return sp.csr_matrix((data, (tgt, src)), shape = (n, n))
 
-def _trans(g, deg):
+def _trans(g):
 	"""
-	Given graph g, and inverse degree matrix. Returns
-	transition matrix for g (uniform over adjacent vertices).
+	Given graph g. Returns transition matrix for g
+	(uniform over adjacent vertices).
 	"""
-	adj = nx.to_scipy_sparse_matrix(g, format = "csc")
-	return (deg * adj).T
+	n, (src, tgt) = g.order(), g.edges()
+	data = _trans_data(n, src, tgt, g.weights(src, tgt))
+	return _trans_matrix(n, src, tgt, data)
 
-def _kl_sym_div(p, q):
-	with np.errstate(divide = "ignore", invalid = "ignore"):
-		pq_log = np.ma.log(np.nan_to_num(p / q))
-		qp_log = np.ma.log(np.nan_to_num(q / p))
-		s1 = p.T.dot(pq_log.filled(0)).item(0)
-		s2 = q.T.dot(qp_log.filled(0)).item(0)
-		return s1 + s2
+# The log of the largest float, which a ratio p / 0 is clipped to
+_LOG_MAX = math.log(np.finfo(float).max)
 
-def _feature(g, p0, tau, alpha):
+def _features(ps, tau):
+	"""
+	Given b x (tau+1) x n array ps of the distributions of b
+	walks, and walk cap tau. Returns b x tau(tau+1)/2 array of
+	random walk feature vectors (size dependent only on tau),
+	the symmetric KL divergences between the distributions of
+	steps s and t for every s < t.
 	"""
-	Given graph g, initial distribution p0, jump probability
-	alpha, and walk cap tau. Returns random walk feature vector
-	(size dependent only on tau).
+	pos = ps > 0
+	logs = np.zeros_like(ps)
+	np.log(ps, out = logs, where = pos)
+
+	# kl[i, s, t] sums ps[i, s] log(ps[i, s] / ps[i, t]), where a
+	# term with ps[i, t] = 0 counts as ps[i, s] times the log of the
+	# largest float
+	tr = lambda a: np.swapaxes(a, 1, 2)
+	kl = np.matmul(ps * logs, tr(pos)) - np.matmul(ps, tr(logs)) \
+		+ _LOG_MAX * np.matmul(ps, tr(~pos))
+	s, t = np.triu_indices(tau+1, 1)
+	return kl[:, s, t] + kl[:, t, s]
+
+def _p0_block(g, p0s):
 	"""
-	n, m = g.order(), []
-	deg_inv = _degrees_inv(g)
-	ps = _walks(g, _trans(g, deg_inv), p0, tau, alpha)
-	for s in range(tau):
-		for t in range(s+1, tau+1):
-			m += [_kl_sym_div(ps[s], ps[t])]
-	return m
+	Given graph g and list of initial distribution generating
+	functions p0s. Returns n x k matrix of the distributions.
+	"""
+	cols = []
+	for p0_i in p0s:
+		p0 = p0_i(g)
+		p0 = p0.toarray() if sp.issparse(p0) else np.asarray(p0)
+		cols += [p0.reshape(-1)]
+	return np.column_stack(cols).astype(float)
 
 #
 # INITIAL DISTRIBUTIONS HELPERS
@@ -82,11 +96,10 @@ def _best_vertex(g, f):
 	the vertex whose degree is closest to f(v)
 	where v is the list of degrees.
 	"""
-	degs = g.degree()
-	k, v = list(degs.keys()), list(degs.values())
+	v = g.degree().tolist()
 	cf = f(v)
 	best_val = min(v, key = lambda x: abs(x-cf))
-	return k[v.index(best_val)]
+	return v.index(best_val)
 
 def _p0_dirac(g, v):
 	"""
@@ -189,95 +202,188 @@ class Walk2VecEmbedding(embeddings.Embedding):
 		if g.order() == 0:
 			return np.array([0]*self.size, dtype = "f")
 
-		# non-empty graphs
-		phi = []
-		for i, p0_i in enumerate(p0s):
-			phi += _feature(g, p0_i(g), tau, alpha)
-		return np.array(phi, dtype = "f")
+		# non-empty graphs, walking from every p0 at once
+		ps = _walks(_trans(g), _p0_block(g, p0s), tau, alpha)
+		phi = _features(ps.transpose(2, 0, 1), tau)
+		return phi.reshape(-1).astype("f")
 
 #
 # WALK2VEC SPARSE CODING
 #
 
-'''
-
-def _all_features(g, tau, alpha):
+def _all_features(g, tau, alpha, block = 256):
 	"""
-	Given graph g, initial distribution generating function
-	p0, and walk cap tau. Returns list of feature vectors
-	over all vertices.
+	Given graph g, jump probability alpha, and walk cap tau.
+	Returns tau(tau+1)/2 x n matrix of the feature vectors of
+	the walks from every vertex, walking from block vertices
+	at once.
 	"""
-	n, xs = g.order(), []
-	for i in range(n):
-		xs += [_feature(g, _p0_dirac(g, i), tau, alpha)]
+	n = g.order()
+	w = _trans(g)
+	xs = np.empty((int((tau**2+tau)/2), n))
+	for i in range(0, n, block):
+		b = min(block, n-i)
+		p0 = np.zeros((n, b))
+		p0[np.arange(i, i+b), np.arange(b)] = 1
+		ps = _walks(w, p0, tau, alpha)
+		xs[:, i:i+b] = _features(ps.transpose(2, 0, 1), tau).T
 	return xs
 
+def _soft(x, t):
+	"""
+	Given array x and threshold t. Returns x soft-thresholded
+	by t.
+	"""
+	return np.sign(x) * np.maximum(np.abs(x) - t, 0)
+
+def _lasso(x, d, lambda1, lambda2 = 0, iters = 200, tol = 1e-6):
+	"""
+	Given m x n matrix x, m x K dictionary d, and penalties
+	lambda1 and lambda2. Returns K x n matrix a whose columns
+	minimise 0.5 ||x - d a||^2 + lambda1 ||a||_1 + 0.5 lambda2
+	||a||^2, solving for every column of x at once by FISTA
+	for at most iters iterations.
+	"""
+	K, n = d.shape[1], x.shape[1]
+	a = np.zeros((K, n))
+	gram = d.T.dot(d)
+	lip = np.linalg.eigvalsh(gram)[-1] + lambda2 if K > 0 else 0
+	if lip <= 0 or n == 0:
+		return a
+
+	dtx = d.T.dot(x)
+	y, t = a, 1.0
+	for _ in range(iters):
+		grad = gram.dot(y) - dtx + lambda2*y
+		a_next = _soft(y - grad/lip, lambda1/lip)
+		t_next = (1.0 + math.sqrt(1.0 + 4.0*t*t)) / 2.0
+		y = a_next + ((t-1.0)/t_next) * (a_next - a)
+		step = np.abs(a_next - a).max()
+		a, t = a_next, t_next
+		if step <= tol * max(1.0, np.abs(a).max()):
+			break
+	return a
+
+#
+# Walk2VecScEmbedding embeds the graph by sparse coding the Walk2Vec
+# features of the walks from every vertex over a dictionary, and
+# pooling the codes.
+# - tau : Nat, steps in the random walk
+# - alpha : (0, 1], jump probability
+# - d : Matrix, tau(tau+1)/2 x K dictionary, or None to learn one
+#   with train
+# - pool : ([[Real]] -> [Real]), pooling function over vertices
+# - param_coding : Dict, coding and training parameters
+#   - lambda1 : Real, L1 penalty of the codes
+#   - lambda2 : Real, L2 penalty of the codes
+#   - K : Nat, atoms of a learnt dictionary
+#   - iter : Nat, minibatches per call to train
+#   - batchsize : Nat, vertices per minibatch
+#   - coding_iter : Nat, most iterations of the lasso
+#
 class Walk2VecScEmbedding(embeddings.Embedding):
 
-	def __init__(self, tau, alpha, d, pool, param_coding):
+	def __init__(self, tau, alpha, d, pool, param_coding = None):
+		default_params = {
+			"lambda1": 0.15,
+			"lambda2": 0,
+			"K": 100,
+			"iter": 100,
+			"batchsize": 5,
+			"coding_iter": 200
+		}
 		self.tau = tau
 		self.alpha = alpha
-		self.d = d 
-		self.pool = pool 
-		self.param_coding = param_coding
+		self.d = d
+		self.pool = pool
+		self.param_coding = {**default_params, **(param_coding or {})}
+		self.atoms = self.param_coding["K"] if d is None else d.shape[1]
+
+		# sufficient statistics of the online dictionary learning
+		self.size = int((tau**2+tau)/2)
+		self._a = np.zeros((self.atoms, self.atoms))
+		self._b = np.zeros((self.size, self.atoms))
 
 		self.params = {
 			"tau": tau,
-			"alpha": alpha
+			"alpha": alpha,
+			"atoms": self.atoms,
+			"lambda1": self.param_coding["lambda1"]
 		}
 
+		self.observation_space = spaces.Box(-np.inf, np.inf, (self.atoms,))
+
 	def embed(self, g, rng):
 		"""
-		Given graph g, initial distribution generating function
-		p0, and walk cap tau, dictionary d, and pooling function
-		pool. Given optional coding parameters params. Returns
-		embedding of g.
+		Given graph g, jump probability alpha, walk cap tau,
+		dictionary d, pooling function pool, and coding parameters.
+		Returns embedding of g.
 		"""
-		tau = self.tau
-		alpha = self.alpha
-		d = self.d 
-		pool = self.pool 
-		param_coding = self.param_coding
-		atoms = d.shape[1]
+		if self.d is None:
+			raise ValueError("Walk2VecScEmbedding needs a dictionary; call train first")
 
 		if g.order() == 0:
-			return np.array([0]*atoms)
+			return np.zeros(self.atoms, dtype = "f")
 
-		xs_mat = np.column_stack(_all_features(g, tau, alpha))
-		xs = np.asfortranarray(xs_mat, dtype=float)
+		xs = _all_features(g, self.tau, self.alpha)
+		a = self._code(xs)
+		return np.asarray(self.pool(a), dtype = "f").reshape(-1)
 
-		default_params = {
-			"lambda1": 0.15
-		}
-		param_coding = {**default_params, **param_coding}
-
-		a = spams.lasso(xs, D = d, **param_coding).todense()
-		return np.asarray(pool(a)).reshape(-1)
-
-	def train(self, g):
+	def train(self, g, rng):
 		"""
-		Given graph g and walk cap tau. Given optional dictionary
-		d and training parameters params. Returns dictionary after
-		training.
+		Given graph g. Updates the dictionary with iter minibatches
+		of the walks from vertices of g, by online dictionary
+		learning, so it can be called on a stream of pools. Returns
+		the dictionary.
 		"""
-		tau = self.tau
-		alpha = self.alpha
-		d = self.d 
-		pool = self.pool 
-		param_coding = self.param_coding
-
 		if g.order() == 0:
-			return d
+			return self.d
+
+		xs = _all_features(g, self.tau, self.alpha)
+		n = xs.shape[1]
+		if self.d is None:
+			self.d = self._init_dictionary(xs, rng)
+
+		batchsize = min(self.param_coding["batchsize"], n)
+		for _ in range(self.param_coding["iter"]):
+			x = xs[:, rng.choice(n, batchsize, replace = False)]
+			a = self._code(x)
+			self._a += a.dot(a.T)
+			self._b += x.dot(a.T)
+			self._update_dictionary()
+		return self.d
+
+	def _code(self, xs):
+		"""
+		Given matrix xs of feature vectors. Returns their codes
+		over the dictionary.
+		"""
+		params = self.param_coding
+		return _lasso(xs, self.d, params["lambda1"], params["lambda2"],
+			params["coding_iter"])
 
-		xs_mat = np.column_stack(_all_features(g, tau, alpha))
-		xs = np.asfortranarray(xs_mat, dtype=float)
-		default_params = {
-			"K": 100,
-			"lambda1": 0.15,
-			"iter": 100,
-			"batchsize": 5,
-			"verbose": False
-		}
-		param_coding = {**default_params, **param_coding}
-		return spams.trainDL(xs, **param_coding)
-'''
+	def _init_dictionary(self, xs, rng):
+		"""
+		Given matrix xs of feature vectors. Returns a dictionary of
+		normalised feature vectors, padded with random atoms if
+		there are too few.
+		"""
+		m, n = xs.shape
+		k = min(n, self.atoms)
+		d = np.column_stack([xs[:, rng.choice(n, k, replace = False)],
+			rng.randn(m, self.atoms - k)])
+		norms = np.linalg.norm(d, axis = 0)
+		return d / np.where(norms > 0, norms, 1)
+
+	def _update_dictionary(self):
+		"""
+		Updates every atom of the dictionary in turn by block
+		coordinate descent on the sufficient statistics, keeping
+		atoms within the unit ball.
+		"""
+		d, a, b = self.d, self._a, self._b
+		for j in range(self.atoms):
+			if a[j, j] <= 0:
+				continue
+			u = d[:, j] + (b[:, j] - d.dot(a[:, j])) / a[j, j]
+			d[:, j] = u / max(np.linalg.norm(u), 1.0)
@@ -1 +1,3 @@
 from gym_kidney.envs.kidney_env import KidneyEnv
+from gym_kidney.envs.vector_env import VectorKidneyEnv
+from gym_kidney.envs.subproc_env import SubprocKidneyEnv
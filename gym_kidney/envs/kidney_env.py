@@ -1,6 +1,7 @@
 import gym
 from gym import error, spaces, utils
 from gym.utils import seeding
+from gym_kidney import pools
 
 import numpy as np
 import networkx as nx
@@ -34,7 +35,7 @@ class KidneyEnv(gym.Env):
 	def _reset(self):
 		self.logger.output_log(self)
 		self.tick = 0
-		self.G = nx.DiGraph()
+		self.G = pools.Pool()
 		self.seed(self.rng_seed + 1)
 		return self._obs()
 
@@ -50,7 +51,7 @@ class KidneyEnv(gym.Env):
 		if self.tick == 0:
 			plt.ion()
 
-		G = self.G
+		G = self.G.to_networkx()
 		attrs = nx.get_node_attributes(G, "ndd")
 		values = ["red" if attrs[v] else "blue" for v in G.nodes()]
 
@@ -0,0 +1,130 @@
+from gym.utils import seeding
+
+import atexit
+import multiprocessing as mp
+import numpy as np
+
+#
+# SubprocKidneyEnv runs each environment in its own worker process.
+# Observations are written by the workers into one shared-memory buffer
+# sized from the observation space, and step_async / step_wait let the
+# caller work while the environments step. Environments are reset as
+# soon as their episode is done. The workers are not daemonic, so they
+# may start processes of their own (as racing formulations does), and
+# are joined by close, which also runs at exit.
+# - env_fns : [(-> Env)], functions building configured environments
+# - context : String, multiprocessing start method
+#
+class SubprocKidneyEnv:
+
+	def __init__(self, env_fns, context = "fork"):
+		env = env_fns[0]()
+		sp = env.observation_space
+		self.observation_space = sp
+		self.action_space = env.action_space
+		env.close()
+
+		self.n = len(env_fns)
+		self.d = sp.n if sp.shape == () else sp.shape[0]
+		self.waiting = False
+		self.closed = False
+
+		ctx = mp.get_context(context)
+		self._buf = ctx.RawArray("f", self.n * self.d)
+		self._obs = np.frombuffer(self._buf, dtype = "f").reshape(self.n, self.d)
+		self.remotes, self.procs = [], []
+
+		for i, env_fn in enumerate(env_fns):
+			remote, worker_remote = ctx.Pipe()
+			proc = ctx.Process(
+				target = _worker,
+				args = (worker_remote, remote, env_fn, self._buf, self.n, self.d, i))
+			proc.start()
+			worker_remote.close()
+			self.remotes.append(remote)
+			self.procs.append(proc)
+
+		atexit.register(self.close)
+
+	# seed : Nat -> [[Nat]]
+	# Seeds every environment with its own seed drawn from seed
+	def seed(self, seed = None):
+		rng, _ = seeding.np_random(seed)
+		seeds = rng.randint(2**31 - 1, size = self.n)
+		for remote, s in zip(self.remotes, seeds):
+			remote.send(("seed", int(s)))
+		return [remote.recv() for remote in self.remotes]
+
+	# reset : -> NP Array
+	# Resets every environment, returning stacked observations
+	def reset(self):
+		for remote in self.remotes:
+			remote.send(("reset", None))
+		for remote in self.remotes:
+			remote.recv()
+		return self._obs.copy()
+
+	# step_async : [Action] -> None
+	# Starts stepping every environment with its action
+	def step_async(self, actions):
+		for remote, action in zip(self.remotes, actions):
+			remote.send(("step", action))
+		self.waiting = True
+
+	# step_wait : -> (NP Array, NP Array, NP Array, [Dict])
+	# Waits for the step started by step_async
+	def step_wait(self):
+		results = [remote.recv() for remote in self.remotes]
+		self.waiting = False
+		rewards, dones, infos = zip(*results)
+		return (self._obs.copy(), np.array(rewards),
+			np.array(dones, dtype = bool), list(infos))
+
+	# step : [Action] -> (NP Array, NP Array, NP Array, [Dict])
+	# Steps every environment with its action
+	def step(self, actions):
+		self.step_async(actions)
+		return self.step_wait()
+
+	# close : -> None
+	# Stops the worker processes
+	def close(self):
+		if self.closed:
+			return
+		if self.waiting:
+			for remote in self.remotes:
+				remote.recv()
+		for remote in self.remotes:
+			remote.send(("close", None))
+		for proc in self.procs:
+			proc.join()
+		self.closed = True
+		atexit.unregister(self.close)
+
+def _worker(remote, parent_remote, env_fn, buf, n, d, i):
+	parent_remote.close()
+	obs = np.frombuffer(buf, dtype = "f").reshape(n, d)[i]
+	env = env_fn()
+
+	try:
+		while True:
+			try:
+				cmd, data = remote.recv()
+			except EOFError:
+				break
+			if cmd == "step":
+				ob, reward, done, info = env.step(data)
+				if done:
+					ob = env.reset()
+				obs[:] = ob
+				remote.send((reward, done, info))
+			elif cmd == "reset":
+				obs[:] = env.reset()
+				remote.send(None)
+			elif cmd == "seed":
+				remote.send(env.seed(data))
+			elif cmd == "close":
+				break
+	finally:
+		env.close()
+		remote.close()
@@ -0,0 +1,108 @@
+import gym
+from gym import spaces
+from gym.utils import seeding
+from gym_kidney import pools
+
+import copy
+import numpy as np
+
+#
+# PoolEnv holds the components of one pool of a VectorKidneyEnv, so that
+# each pool keeps its own statistics and embedding state, and is what the
+# logger sees when that pool's episode is logged.
+# - action : Action, the pool's copy of the action
+# - embedding : Embedding, the pool's copy of the embedding
+# - model : Model, the pool's copy of the model
+#
+class PoolEnv:
+
+	def __init__(self, action, embedding, model):
+		self.action = action
+		self.embedding = embedding
+		self.model = model
+		self.rng_seed = None
+		action.env = embedding.env = model.env = self
+
+#
+# VectorKidneyEnv steps n kidney exchange pools with the same components,
+# taking a batch of actions and returning stacked observations, rewards
+# and dones. Every pool has its own RNG seeded from the environment seed
+# and is reset as soon as its episode is done. The components passed in
+# are templates: each pool steps its own copy of them, so statistics and
+# stateful embeddings never mix between pools. The pools are stepped
+# one after another through the scalar action, model and embedding;
+# only the observations, rewards and dones are batched.
+# - n : Nat, number of pools
+#
+class VectorKidneyEnv(gym.Env):
+	metadata = { "render.modes" : [] }
+
+	def __init__(self, n):
+		self.n = n
+
+	def setup(self):
+		sp = self.embedding.observation_space
+		d = sp.n if sp.shape == () else sp.shape[0]
+
+		self.action_space = self.action.action_space
+		self.observation_space = spaces.Box(sp.low[0], sp.high[0],
+			(self.n, d))
+		self.pools = [self._pool_env() for _ in range(self.n)]
+		self._seed()
+
+	def _pool_env(self):
+		memo = { id(self) : self, id(self.logger) : self.logger }
+		return PoolEnv(
+			copy.deepcopy(self.action, memo),
+			copy.deepcopy(self.embedding, memo),
+			copy.deepcopy(self.model, memo))
+
+	def _seed(self, seed = None):
+		self.rng, seed = seeding.np_random(seed)
+		self.rng_seed = seed
+		self.rng_seeds = self.rng.randint(2**31 - 1, size = self.n)
+		self.rngs = [seeding.np_random(int(s))[0] for s in self.rng_seeds]
+		for p, s in zip(self.pools, self.rng_seeds):
+			p.rng_seed = int(s)
+		return [seed]
+
+	def _step(self, actions):
+		obs = []
+		rewards = np.zeros(self.n)
+		dones = np.zeros(self.n, dtype = bool)
+
+		for i, action in enumerate(actions):
+			G, rng, p = self.Gs[i], self.rngs[i], self.pools[i]
+			G, rewards[i] = p.action.do_action(G, action)
+			G, dones[i] = p.model.evolve(G, rng, self.ticks[i])
+
+			self.Gs[i] = G
+			self.ticks[i] += 1
+
+			if dones[i]:
+				self.logger.output_log(p)
+				self._reset_pool(i)
+			obs.append(self._obs(i))
+
+		return np.stack(obs), rewards, dones, {}
+
+	def _reset(self):
+		for p in self.pools:
+			self.logger.output_log(p)
+		self.Gs = [pools.Pool() for _ in range(self.n)]
+		self.ticks = np.zeros(self.n, dtype = int)
+
+		for i in range(self.n):
+			self._reset_pool(i)
+
+		return np.stack([self._obs(i) for i in range(self.n)])
+
+	def _reset_pool(self, i):
+		self.ticks[i] = 0
+		self.Gs[i].clear()
+		self.rng_seeds[i] += 1
+		self.rngs[i] = seeding.np_random(int(self.rng_seeds[i]))[0]
+		self.pools[i].rng_seed = int(self.rng_seeds[i])
+
+	def _obs(self, i):
+		return self.pools[i].embedding.embed(self.Gs[i], self.rngs[i])
@@ -1,4 +1,5 @@
 from gym_kidney.models.model import *
+from gym_kidney.models.exchange import *
 from gym_kidney.models.data import *
 from gym_kidney.models.heterogeneous import *
 from gym_kidney.models.homogeneous import *
@@ -0,0 +1,125 @@
+from gym_kidney import pools
+
+import argparse
+import csv
+import os
+import numpy as np
+import scipy.sparse as sp
+
+BLOODS = pools.BLOODS
+
+# EXCHANGE_FILES : [String]
+# Arrays of a converted exchange, each stored as NAME.npy in a directory
+EXCHANGE_FILES = ["indptr", "indices", "t_indptr", "t_indices", "ndd", "bp", "bd"]
+
+#
+# Exchange is a reference kidney exchange the data models sample
+# vertices from. Edges are CSR rows of successors and of predecessors,
+# and vertex attributes are columns coded as in the pool.
+#
+class Exchange:
+
+	def __init__(self, indptr, indices, t_indptr, t_indices, ndd, bp, bd):
+		self.indptr = indptr
+		self.indices = indices
+		self.t_indptr = t_indptr
+		self.t_indices = t_indices
+		self.ndd = ndd
+		self.bp = bp
+		self.bd = bd
+
+	# order : -> Nat
+	# Number of vertices in the exchange
+	def order(self):
+		return len(self.ndd)
+
+	# successors : Nat -> [Nat]
+	# Targets of edges out of u
+	def successors(self, u):
+		return self.indices[self.indptr[u]:self.indptr[u + 1]]
+
+	# predecessors : Nat -> [Nat]
+	# Sources of edges into u
+	def predecessors(self, u):
+		return self.t_indices[self.t_indptr[u]:self.t_indptr[u + 1]]
+
+# load_exchange : String, String -> Exchange
+# Memory-maps a converted exchange directory, or parses the CSV files
+def load_exchange(data, details = None):
+	if os.path.isdir(data):
+		arrays = [np.load(_exchange_file(data, f), mmap_mode = "r")
+			for f in EXCHANGE_FILES]
+		return Exchange(*arrays)
+
+	return _read_exchange(data, details)
+
+# convert_exchange : String, String, String -> Exchange
+# Converts the CSV files of an exchange to a directory of arrays
+def convert_exchange(data, details, path):
+	ex = _read_exchange(data, details)
+	os.makedirs(path, exist_ok = True)
+
+	for f in EXCHANGE_FILES:
+		np.save(_exchange_file(path, f), getattr(ex, f))
+
+	return load_exchange(path)
+
+def _exchange_file(path, f):
+	return os.path.join(path, "%s.npy" % f)
+
+def _read_exchange(data, details):
+	# adjacency matrix, one row at a time
+	indptr, indices = [0], []
+	with open(data, mode = "r") as handle:
+		for line in handle:
+			if not line.strip():
+				continue
+			row = np.array(line.split(","), dtype = float)
+			cols = np.flatnonzero(row)
+			indices.append(cols)
+			indptr.append(indptr[-1] + len(cols))
+
+	n = len(indptr) - 1
+	indices = np.concatenate(indices) if indices else np.arange(0)
+	adj = sp.csr_matrix(
+		(np.ones(len(indices), dtype = bool), indices, indptr),
+		shape = (n, n))
+	adj_t = adj.T.tocsr()
+
+	# vertex attributes
+	ndd = np.zeros(n, dtype = bool)
+	bp = np.full(n, -1, dtype = np.int8)
+	bd = np.full(n, -1, dtype = np.int8)
+
+	with open(details, mode = "r") as handle:
+		read = csv.reader(handle)
+		for row in read:
+			u = int(row[0])
+			ndd[u] = row[1] == "1"
+			bp[u] = BLOODS.index(row[2])
+			bd[u] = BLOODS.index(row[3])
+
+	return Exchange(
+		adj.indptr.astype(np.int64),
+		adj.indices.astype(np.int32),
+		adj_t.indptr.astype(np.int64),
+		adj_t.indices.astype(np.int32),
+		ndd, bp, bd)
+
+def start():
+	parser = argparse.ArgumentParser(
+		"Convert the CSV files of a kidney exchange to memory-mappable arrays")
+	parser.add_argument("data",
+		help = "CSV containing the adjacency matrix")
+	parser.add_argument("details",
+		help = "CSV containing vertex attributes")
+	parser.add_argument("path",
+		help = "Directory to write the arrays to")
+
+	args = parser.parse_args()
+	ex = convert_exchange(args.data, args.details, args.path)
+	print("vertices: {}".format(ex.order()))
+	print("edges: {}".format(len(ex.indices)))
+
+if __name__ == "__main__":
+	start()
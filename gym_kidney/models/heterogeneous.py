@@ -1,6 +1,6 @@
 from gym_kidney import models
 
-import networkx as nx
+import numpy as np
 
 #
 # HeterogeneousModel evolves the graph according to a heterogeneous
@@ -12,10 +12,11 @@ import networkx as nx
 # - p_a : [0, 1], probability of NDD
 # - p_s : [0, 1], probability of patient with high PRA
 # - len : Nat, ticks per episode
+# - sparse : Bool, whether edges are drawn by skipping (None picks by density)
 #
 class HeterogeneousModel(models.Model):
 
-	def __init__(self, m, k, p_l, p_h, p_a, p_s, len):
+	def __init__(self, m, k, p_l, p_h, p_a, p_s, len, sparse = None):
 		self.m = m
 		self.k = k
 		self.p_l = p_l
@@ -23,6 +24,7 @@ class HeterogeneousModel(models.Model):
 		self.p_a = p_a
 		self.p_s = p_s
 		self.len = len
+		self.sparse = sparse
 
 		self.params = {
 			"m": m,
@@ -40,26 +42,14 @@ class HeterogeneousModel(models.Model):
 		}
 
 	def arrive(self, G, rng):
-		n1 = G.order()
 		n2 = rng.poisson(self.m / self.k)
-		new = range(n1, n1 + n2)
-
-		for u in new:
-			ndd_u = rng.rand() < self.p_a
-			high_u = rng.rand() < self.p_s
-			G.add_node(u, ndd = ndd_u, high = high_u)
 
-			for v in G.nodes():
-				ndd_v = G.node[v]["ndd"]
-				high_v = G.node[v]["high"]
-				p_u = self.p_h if high_u else self.p_l
-				p_v = self.p_h if high_v else self.p_l
-
-				if u == v: continue
-				if rng.rand() < p_v and not ndd_v:
-					G.add_edge(u, v)
-				if rng.rand() < p_u and not ndd_u:
-					G.add_edge(v, u)
+		if n2 > 0:
+			ndd = rng.rand(n2) < self.p_a
+			high = rng.rand(n2) < self.p_s
+			new = G.add_vertices(n2, ndd = ndd, high = high)
+			p = np.where(G.high, self.p_h, self.p_l)
+			self._random_edges(G, rng, new, p)
 
 		self.stats["arrived"] += n2
 		return G
@@ -67,11 +57,11 @@ class HeterogeneousModel(models.Model):
 	def depart(self, G, rng):
 		n1 = G.order()
 		n2 = rng.binomial(n1, 1.0 / self.k)
-		old = rng.choice(G.nodes(), n2, replace = False).tolist()
+		old = rng.choice(n1, n2, replace = False)
 
-		G.remove_nodes_from(old)
+		G.remove_vertices(old)
 		self.stats["departed"] += n2
-		return nx.convert_node_labels_to_integers(G)
+		return G
 
 	def done(self, tick):
 		return tick >= self.len
@@ -1,7 +1,5 @@
 from gym_kidney import models
 
-import networkx as nx
-
 #
 # HomogeneousModel evolves the graph according to a homogeneous
 # Erdős–Rényi random model.
@@ -10,15 +8,17 @@ import networkx as nx
 # - p : [0, 1], probability of edge between vertices
 # - p_a : [0, 1], probability of NDD
 # - len : Nat, ticks per episode
+# - sparse : Bool, whether edges are drawn by skipping (None picks by density)
 #
 class HomogeneousModel(models.Model):
 
-	def __init__(self, m, k, p, p_a, len):
+	def __init__(self, m, k, p, p_a, len, sparse = None):
 		self.m = m
 		self.k = k
 		self.p = p
 		self.p_a = p_a
 		self.len = len
+		self.sparse = sparse
 
 		self.params = {
 			"m": m,
@@ -34,22 +34,12 @@ class HomogeneousModel(models.Model):
 		}
 
 	def arrive(self, G, rng):
-		n1 = G.order()
 		n2 = rng.poisson(self.m / self.k)
-		new = range(n1, n1 + n2)
-
-		for u in new:
-			ndd_u = rng.rand() < self.p_a
-			G.add_node(u, ndd = ndd_u)
 
-			for v in G.nodes():
-				ndd_v = G.node[v]["ndd"]
-
-				if u == v: continue
-				if rng.rand() < self.p and not ndd_v:
-					G.add_edge(u, v)
-				if rng.rand() < self.p and not ndd_u:
-					G.add_edge(v, u)
+		if n2 > 0:
+			ndd = rng.rand(n2) < self.p_a
+			new = G.add_vertices(n2, ndd = ndd)
+			self._random_edges(G, rng, new, self.p)
 
 		self.stats["arrived"] += n2
 		return G
@@ -57,11 +47,11 @@ class HomogeneousModel(models.Model):
 	def depart(self, G, rng):
 		n1 = G.order()
 		n2 = rng.binomial(n1, 1.0 / self.k)
-		old = rng.choice(G.nodes(), n2, replace = False).tolist()
+		old = rng.choice(n1, n2, replace = False)
 
-		G.remove_nodes_from(old)
+		G.remove_vertices(old)
 		self.stats["departed"] += n2
-		return nx.convert_node_labels_to_integers(G)
+		return G
 
 	def done(self, tick):
 		return tick >= self.len
@@ -1,3 +1,10 @@
+import numpy as np
+
+# SPARSE_P : Float
+# Largest edge probability for which random edges are drawn by skipping
+# between successes
+SPARSE_P = 0.1
+
 #
 # Model is an abstract class to be implemented by all models
 # generating the environment.
@@ -12,20 +19,24 @@ class Model:
 	# The values to record after evolving
 	stats = {}
 
-	# evolve : Graph, RNG, Nat -> (Graph,  Bool)
-	# Evolves the graph by arriving and departing vertices
+	# sparse : Bool
+	# Whether random edges are drawn by skipping (None picks by density)
+	sparse = None
+
+	# evolve : Pool, RNG, Nat -> (Pool, Bool)
+	# Evolves the pool by arriving and departing vertices
 	def evolve(self, G, rng, tick):
 		G = self.arrive(G, rng)
 		G = self.depart(G, rng)
 		return G, self.done(tick)
 
-	# arrive : Graph -> Graph
-	# Arrives vertices in the graph
+	# arrive : Pool -> Pool
+	# Arrives vertices in the pool
 	def arrive(self, G):
 		raise NotImplementedError
 
-	# depart : Graph -> Graph
-	# Departs vertices in the graph
+	# depart : Pool -> Pool
+	# Departs vertices in the pool
 	def depart(self, G):
 		raise NotImplementedError
 
@@ -33,3 +44,55 @@ class Model:
 	# Whether the episode is over
 	def done(self, tick):
 		raise NotImplementedError
+
+	# _random_edges : Pool, RNG, [Nat], [Float] -> None
+	# Adds Erdős–Rényi edges between the new vertices and every other
+	# vertex, where p[v] is the probability of an edge into vertex v
+	def _random_edges(self, G, rng, new, p):
+		n1, n2 = new[0], len(new)
+		p = np.where(G.ndd, 0.0, p)
+
+		sparse = self.sparse
+		if sparse is None:
+			sparse = p.max() < SPARSE_P
+
+		if sparse:
+			src, tgt = self._skip_pairs(rng, new, np.arange(G.order()), p)
+			keep = src != tgt
+			G.add_edges(src[keep], tgt[keep])
+			src, tgt = self._skip_pairs(rng, np.arange(n1), new, p[new])
+			G.add_edges(src, tgt)
+		else:
+			out = rng.rand(n2, G.order()) < p
+			out[np.arange(n2), new] = False
+			into = rng.rand(n1, n2) < p[new]
+
+			G.adj[n1:, :] = out
+			G.adj[:n1, n1:] = into
+
+	# _skip_pairs : RNG, [Nat], [Nat], [Float] -> ([Nat], [Nat])
+	# Samples the pairs (rows[i], cols[j]) succeeding with probability p[j]
+	def _skip_pairs(self, rng, rows, cols, p):
+		src, tgt = [rows[:0]], [cols[:0]]
+
+		for p_c in np.unique(p[p > 0]):
+			cs = cols[p == p_c]
+			k = self._skip(rng, len(rows) * len(cs), p_c)
+			src.append(rows[k // len(cs)])
+			tgt.append(cs[k % len(cs)])
+
+		return np.concatenate(src), np.concatenate(tgt)
+
+	# _skip : RNG, Nat, Float -> [Nat]
+	# Indices of the successes among n Bernoulli trials, found by drawing
+	# the geometric gaps between consecutive successes
+	def _skip(self, rng, n, p):
+		ks, last = [np.arange(0)], -1
+
+		while last < n - 1:
+			size = int((n - last) * p * 1.2) + 16
+			k = last + np.cumsum(rng.geometric(p, size))
+			ks.append(k[k < n])
+			last = k[-1]
+
+		return np.concatenate(ks)
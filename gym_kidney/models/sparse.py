@@ -1,10 +1,9 @@
 from gym_kidney import models
+from gym_kidney import pools
 
 import numpy as np
-import networkx as nx
-import csv
 
-BLOODS = ["A", "B", "AB", "O", "-"]
+BLOODS = pools.BLOODS
 
 #
 # SparseModel evolves the graph by simulating on real exchange
@@ -12,7 +11,7 @@ BLOODS = ["A", "B", "AB", "O", "-"]
 # - m : Nat, expected vertices per period
 # - k : Nat, ticks per period
 # - p_d : [0, 1], probability of dropping an edge
-# - data : String, path to CSV containing data
+# - data : String, path to CSV containing data, or to a converted exchange
 # - details : String, path to CSV containing vertex attributes
 # - len : Nat, ticks per episode
 #
@@ -49,40 +48,27 @@ class SparseModel(models.Model):
 
 	def arrive(self, G, rng):
 		R = self._ref
-		n1 = G.order()
 		n2 = rng.poisson(self.m / self.k)
-		new = range(n1, n1 + n2)
-
-		# label map
-		r_to_g = self._inv(nx.get_node_attributes(G, "r_id"))
 
-		for u in new:
+		for _ in range(n2):
 			# add vertex
 			r_id = rng.randint(0, R.order())
-			attr_u = R.node[r_id]
-			attr_u["r_id"] = r_id
-			G.add_node(u, attr_u)
-			self.stats["%s_patient_arrived" % attr_u["bp"]] += 1
-			self.stats["%s_donor_arrived" % attr_u["bd"]] += 1
-
-			# add to label map
-			if r_id in r_to_g:
-				r_to_g[r_id] += [u]
-			else:
-				r_to_g[r_id] = [u]
+			u = G.add_vertices(1,
+				ndd = R.ndd[r_id],
+				bp = R.bp[r_id],
+				bd = R.bd[r_id],
+				r_id = r_id)[0]
+			self.stats["%s_patient_arrived" % BLOODS[G.bp[u]]] += 1
+			self.stats["%s_donor_arrived" % BLOODS[G.bd[u]]] += 1
+
 			# edges
-			for vs in list(map(r_to_g.get, R.successors(r_id))):
-				if vs == None: continue
-				for v in vs:
-					if rng.rand() > self.p_d:
-						G.add_edge(u, v)
-
-			for vs in list(map(r_to_g.get, R.predecessors(r_id))):
-				r_id = rng.randint(0, R.order())
-				if vs == None: continue
-				for v in vs:
-					if rng.rand() > self.p_d:
-						G.add_edge(v, u)
+			vs = G.r_slots(R.successors(r_id))
+			vs = vs[rng.rand(len(vs)) > self.p_d]
+			G.add_edges(u, vs)
+
+			vs = G.r_slots(R.predecessors(r_id))
+			vs = vs[rng.rand(len(vs)) > self.p_d]
+			G.add_edges(vs, u)
 
 		self.stats["arrived"] += n2
 		return G
@@ -92,40 +78,20 @@ class SparseModel(models.Model):
 		n2 = rng.binomial(n1, 1.0 / self.k)
 
 		if G.order() <= n2:
-			old = G.nodes()
+			old = np.arange(n1)
 		else:
-			old = rng.choice(G.nodes(), n2, replace = False)
-			old = old.tolist()
+			old = rng.choice(n1, n2, replace = False)
 
 		for v in old:
-			self.stats["%s_patient_departed" % G.node[v]["bp"]] += 1
-			self.stats["%s_donor_departed" % G.node[v]["bd"]] += 1
+			self.stats["%s_patient_departed" % BLOODS[G.bp[v]]] += 1
+			self.stats["%s_donor_departed" % BLOODS[G.bd[v]]] += 1
 
-		G.remove_nodes_from(old)
+		G.remove_vertices(old)
 		self.stats["departed"] += n2
-		return nx.convert_node_labels_to_integers(G)
+		return G
 
 	def done(self, tick):
 		return tick >= self.len
 
 	def _load_data(self):
-		# adjacency matrix
-		adj = np.loadtxt(self.data, delimiter = ",")
-		self._ref = nx.DiGraph()
-		self._ref = nx.from_numpy_matrix(adj, create_using = self._ref)
-
-		# vertex attributes
-		with open(self.details, mode = "r") as handle:
-			read = csv.reader(handle)
-			for row in read:
-				u = self._ref.node[int(row[0])]
-				u["ndd"] = row[1] == "1"
-				u["bp"] = row[2]
-				u["bd"] = row[3]
-
-	def _inv(self, d):
-		inv_map = {}
-		for k, v in d.items():
-			inv_map[v] = inv_map.get(v, [])
-			inv_map[v].append(k)
-		return inv_map
+		self._ref = models.load_exchange(self.data, self.details)
@@ -0,0 +1 @@
+from gym_kidney.pools.pool import *
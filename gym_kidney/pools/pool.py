@@ -0,0 +1,249 @@
+import itertools
+import numpy as np
+import scipy.sparse as sp
+import networkx as nx
+
+# BLOODS : [String]
+# Blood types, indexed by the codes stored in the bp and bd columns
+BLOODS = ["A", "B", "AB", "O", "-"]
+
+#
+# Pool is the state of the kidney exchange. Vertices occupy the slots
+# 0, ..., n - 1, their attributes are NumPy columns, and compatibilities
+# are a dense boolean adjacency matrix, which the models and embeddings
+# index by rows, columns and subsets (see the README for the trade-off
+# against a sparse layout). Removing vertices moves the last
+# vertices into the freed slots so the pool stays compact, so every
+# vertex also gets a uid that is never reused by the pool. The slots of
+# every reference vertex are indexed for the data-driven models.
+# - capacity : Nat, initial number of slots
+#
+class Pool:
+
+	def __init__(self, capacity = 64):
+		self.n = 0
+		self._next_uid = 0
+		self._weight = None
+		self._r_slots = {}
+		self._alloc(max(capacity, 1))
+
+	# order : -> Nat
+	# Number of vertices in the pool
+	def order(self):
+		return self.n
+
+	def __len__(self):
+		return self.n
+
+	@property
+	def ndd(self):
+		return self._ndd[:self.n]
+
+	@property
+	def high(self):
+		return self._high[:self.n]
+
+	@property
+	def bp(self):
+		return self._bp[:self.n]
+
+	@property
+	def bd(self):
+		return self._bd[:self.n]
+
+	@property
+	def r_id(self):
+		return self._r_id[:self.n]
+
+	@property
+	def uid(self):
+		return self._uid[:self.n]
+
+	@property
+	def adj(self):
+		return self._adj[:self.n, :self.n]
+
+	# add_vertices : Nat, ... -> [Nat]
+	# Adds k vertices with the given attributes (scalars or arrays),
+	# returning their slots
+	def add_vertices(self, k, ndd = False, high = False,
+		bp = -1, bd = -1, r_id = -1):
+		n1, n2 = self.n, self.n + k
+		if n2 > self._cap:
+			self._grow(n2)
+
+		self._ndd[n1:n2] = ndd
+		self._high[n1:n2] = high
+		self._bp[n1:n2] = bp
+		self._bd[n1:n2] = bd
+		self._r_id[n1:n2] = r_id
+		self._uid[n1:n2] = np.arange(self._next_uid, self._next_uid + k)
+		self._next_uid += k
+
+		# slots may hold stale rows and columns of removed vertices
+		self._adj[n1:n2, :n2] = False
+		self._adj[:n2, n1:n2] = False
+		if self._weight is not None:
+			self._weight[n1:n2, :n2] = 1.0
+			self._weight[:n2, n1:n2] = 1.0
+
+		self.n = n2
+		new = np.arange(n1, n2)
+		self._index(new)
+		return new
+
+	# add_edges : [Nat], [Nat], [Float] -> None
+	# Adds the edges src[i] -> tgt[i], optionally with weights
+	def add_edges(self, src, tgt, weight = None):
+		self._adj[src, tgt] = True
+		if weight is not None:
+			self.set_weights(src, tgt, weight)
+
+	# remove_vertices : [Nat] -> ([Nat], [Nat])
+	# Removes vertices, filling the freed slots with the last vertices.
+	# Returns (old, new) such that the vertex at old[i] is now at new[i]
+	def remove_vertices(self, vs):
+		vs = np.unique(np.asarray(vs, dtype = int))
+		n1 = self.n
+		n2 = n1 - len(vs)
+
+		new = vs[vs < n2]
+		old = np.setdiff1d(np.arange(n2, n1), vs, assume_unique = True)
+
+		self._unindex(vs)
+		if len(new) > 0:
+			self._unindex(old)
+			for col in self._columns():
+				col[new] = col[old]
+			self._move(self._adj, old, new, n1)
+			if self._weight is not None:
+				self._move(self._weight, old, new, n1)
+			self._index(new)
+
+		self.n = n2
+		return old, new
+
+	# clear : -> None
+	# Removes every vertex, keeping the allocated slots
+	def clear(self):
+		self.n = 0
+		self._r_slots = {}
+
+	# edges : -> ([Nat], [Nat])
+	# Sources and targets of all edges
+	def edges(self):
+		return np.nonzero(self.adj)
+
+	# r_slots : [Nat] -> [Nat]
+	# Slots of the vertices copied from the given reference vertices
+	def r_slots(self, r_ids):
+		slots = [self._r_slots.get(r, ()) for r in r_ids.tolist()]
+		return np.fromiter(itertools.chain.from_iterable(slots), dtype = int)
+
+	# successors : Nat -> [Nat]
+	# Targets of edges out of u
+	def successors(self, u):
+		return np.flatnonzero(self._adj[u, :self.n])
+
+	# predecessors : Nat -> [Nat]
+	# Sources of edges into u
+	def predecessors(self, u):
+		return np.flatnonzero(self._adj[:self.n, u])
+
+	# degree : -> [Nat]
+	# Sum of in-degree and out-degree of every vertex
+	def degree(self):
+		adj = self.adj
+		return adj.sum(axis = 0) + adj.sum(axis = 1)
+
+	# weights : [Nat], [Nat] -> [Float]
+	# Weights of the edges src[i] -> tgt[i]
+	def weights(self, src, tgt):
+		if self._weight is None:
+			return np.ones(len(src))
+		return self._weight[src, tgt]
+
+	# set_weights : [Nat], [Nat], [Float] -> None
+	# Sets the weights of the edges src[i] -> tgt[i]
+	def set_weights(self, src, tgt, weight):
+		if self._weight is None:
+			self._weight = np.ones((self._cap, self._cap), dtype = "f")
+		self._weight[src, tgt] = weight
+
+	# to_sparse : String -> Matrix
+	# Weighted adjacency matrix in the given SciPy sparse format
+	def to_sparse(self, format = "csr"):
+		src, tgt = self.edges()
+		A = sp.coo_matrix((self.weights(src, tgt), (src, tgt)),
+			shape = (self.n, self.n))
+		return A.asformat(format)
+
+	# to_networkx : -> Graph
+	# NetworkX view of the pool, used for rendering
+	def to_networkx(self):
+		G = nx.DiGraph()
+		for u in range(self.n):
+			G.add_node(u,
+				ndd = bool(self._ndd[u]),
+				high = bool(self._high[u]),
+				bp = self._blood(self._bp[u]),
+				bd = self._blood(self._bd[u]),
+				r_id = int(self._r_id[u]))
+
+		src, tgt = self.edges()
+		w = self.weights(src, tgt)
+		for u, v, w_uv in zip(src.tolist(), tgt.tolist(), w.tolist()):
+			G.add_edge(u, v, weight = w_uv)
+
+		return G
+
+	def _blood(self, code):
+		return BLOODS[code] if code >= 0 else None
+
+	def _index(self, us):
+		r_ids = self._r_id[us]
+		if not (r_ids >= 0).any():
+			return
+		for u, r in zip(us.tolist(), r_ids.tolist()):
+			if r >= 0:
+				self._r_slots.setdefault(r, set()).add(u)
+
+	def _unindex(self, us):
+		r_ids = self._r_id[us]
+		if not (r_ids >= 0).any():
+			return
+		for u, r in zip(us.tolist(), r_ids.tolist()):
+			if r >= 0:
+				slots = self._r_slots[r]
+				slots.discard(u)
+				if not slots:
+					del self._r_slots[r]
+
+	def _columns(self):
+		return [self._ndd, self._high, self._bp, self._bd, self._r_id, self._uid]
+
+	def _alloc(self, cap):
+		self._cap = cap
+		self._ndd = np.zeros(cap, dtype = bool)
+		self._high = np.zeros(cap, dtype = bool)
+		self._bp = np.full(cap, -1, dtype = np.int8)
+		self._bd = np.full(cap, -1, dtype = np.int8)
+		self._r_id = np.full(cap, -1, dtype = np.int64)
+		self._uid = np.zeros(cap, dtype = np.int64)
+		self._adj = np.zeros((cap, cap), dtype = bool)
+
+	def _grow(self, need):
+		n = self.n
+		columns, adj, weight = self._columns(), self._adj, self._weight
+		self._alloc(max(need, 2 * self._cap))
+
+		for new_col, old_col in zip(self._columns(), columns):
+			new_col[:n] = old_col[:n]
+		self._adj[:n, :n] = adj[:n, :n]
+		if weight is not None:
+			self._weight = np.ones((self._cap, self._cap), dtype = "f")
+			self._weight[:n, :n] = weight[:n, :n]
+
+	def _move(self, mat, old, new, n):
+		mat[new, :n] = mat[old, :n]
+		mat[:n, new] = mat[:n, old]
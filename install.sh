@@ -42,7 +42,3 @@ git clone https://github.com/camoy/gym-kidney
 cd gym-kidney
 pip install --user -e .
 cd ~
-wget https://gforge.inria.fr/frs/download.php/file/36849/spams-python3-v2.6-2017-06-06.tar.gz
-tar xvfz spams-python3-v2.6-2017-06-06.tar.gz
-cd spams-python3
-python3 setup.py install --user
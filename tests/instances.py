@@ -0,0 +1,31 @@
+import numpy as np
+
+from gym_kidney._solver import kidney_ip
+from gym_kidney._solver.kidney_digraph import digraph_from_arrays
+from gym_kidney._solver.kidney_ndds import ndds_from_arrays
+
+def random_instance(n, k, p, seed, weighted = False, max_cycle = 3, max_chain = 3,
+	perm = None, ndd_perm = None):
+	"""A random instance of n pairs and k NDDs with edge probability p.
+	Given perm and ndd_perm, pair i and NDD i are relabelled perm[i] and
+	ndd_perm[i], and the edges are added in a shuffled order."""
+	rng = np.random.RandomState(seed)
+	adj = rng.rand(n, n) < p
+	np.fill_diagonal(adj, False)
+	src, tgt = np.nonzero(adj)
+	ndd_src, ndd_tgt = np.nonzero(rng.rand(k, n) < p)
+	score = rng.rand(len(src)) + 0.5 if weighted else np.ones(len(src))
+	ndd_score = rng.rand(len(ndd_src)) + 0.5 if weighted else np.ones(len(ndd_src))
+
+	if perm is not None:
+		perm, ndd_perm = np.asarray(perm), np.asarray(ndd_perm)
+		order = rng.permutation(len(src))
+		src, tgt, score = perm[src[order]], perm[tgt[order]], score[order]
+		order = rng.permutation(len(ndd_src))
+		ndd_src, ndd_tgt = ndd_perm[ndd_src[order]], perm[ndd_tgt[order]]
+		ndd_score = ndd_score[order]
+
+	digraph = digraph_from_arrays(n, src.tolist(), tgt.tolist(), score.tolist())
+	ndds = ndds_from_arrays(k, digraph, ndd_src.tolist(), ndd_tgt.tolist(),
+		ndd_score.tolist())
+	return kidney_ip.OptConfig(digraph, ndds, max_cycle, max_chain)
@@ -0,0 +1,42 @@
+import copy
+
+import pytest
+
+from gym_kidney._solver import kidney_solver
+from instances import random_instance
+
+@pytest.mark.parametrize("weighted", [False, True])
+@pytest.mark.parametrize("seed", range(10))
+def test_bnb_matches_picef(seed, weighted):
+	cfg = random_instance(16, 2, 0.25, seed, weighted = weighted)
+	bnb = kidney_solver.solve_kep(cfg, "picef", backend = "bnb")
+	picef = kidney_solver.solve_kep(cfg, "picef", backend = "highs")
+	assert bnb.optimal
+	assert bnb.gap == 0
+	assert bnb.total_score == pytest.approx(picef.total_score)
+
+def test_bnb_dense_unit_weights():
+	# unit weights give the LP bound many ties; this used to take millions
+	# of nodes
+	cfg = random_instance(17, 3, 0.45, 0)
+	bnb = kidney_solver.solve_kep(cfg, "picef", backend = "bnb")
+	picef = kidney_solver.solve_kep(cfg, "picef", backend = "highs")
+	assert bnb.total_score == pytest.approx(picef.total_score)
+	assert bnb.nodes < 100
+
+@pytest.mark.parametrize("seed", range(5))
+def test_bnb_gap_is_proven(seed):
+	cfg = random_instance(16, 2, 0.25, seed, weighted = True)
+	opt = kidney_solver.solve_kep(cfg, "picef", backend = "highs").total_score
+	cfg.gap = 0.2
+	bnb = kidney_solver.solve_kep(cfg, "picef", backend = "bnb")
+	assert bnb.optimal
+	assert bnb.gap <= 0.2
+	assert bnb.total_score >= (1 - bnb.gap) * opt - 1e-9
+
+def test_bnb_time_limit():
+	cfg = random_instance(40, 3, 0.2, 0)
+	cfg.timelimit = 0
+	bnb = kidney_solver.solve_kep(cfg, "picef", backend = "bnb")
+	assert not bnb.optimal
+	assert bnb.gap == 1
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from gym_kidney._solver import kidney_cache, kidney_solver
+from instances import random_instance
+
+@pytest.mark.parametrize("seed", range(8))
+def test_cache_hits_permuted_instance(seed):
+	n, k = 14, 3
+	cache = kidney_cache.SolutionCache()
+	cfg = random_instance(n, k, 0.2, seed, weighted = True)
+	first = kidney_solver.solve_kep(cfg, "picef", backend = "highs",
+		cache = cache)
+	assert (cache.hits, cache.misses) == (0, 1)
+
+	rng = np.random.RandomState(seed)
+	permuted = random_instance(n, k, 0.2, seed, weighted = True,
+		perm = rng.permutation(n), ndd_perm = rng.permutation(k))
+	hit = kidney_solver.solve_kep(permuted, "picef", backend = "highs",
+		cache = cache)
+	assert (cache.hits, cache.misses) == (1, 1)
+
+	# the cached solution is decoded onto the permuted instance
+	direct = kidney_solver.solve_kep(permuted, "picef", backend = "highs")
+	assert hit.total_score == pytest.approx(direct.total_score)
+	assert hit.total_score == pytest.approx(first.total_score)
+
+def test_cache_misses_changed_instance():
+	cache = kidney_cache.SolutionCache()
+	cfg = random_instance(14, 3, 0.2, 0, weighted = True)
+	kidney_solver.solve_kep(cfg, "picef", backend = "highs", cache = cache)
+	cfg.digraph.es[0].score += 1
+	kidney_solver.solve_kep(cfg, "picef", backend = "highs", cache = cache)
+	assert (cache.hits, cache.misses) == (0, 2)
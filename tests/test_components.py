@@ -0,0 +1,67 @@
+import threading
+
+import numpy as np
+import pytest
+
+from gym_kidney._solver import kidney_components, kidney_highs, kidney_ip, kidney_solver
+from gym_kidney._solver.kidney_digraph import digraph_from_arrays
+from gym_kidney._solver.kidney_ndds import ndds_from_arrays
+
+BACKENDS = ["highs", "bnb",
+	pytest.param("gurobi", marks = pytest.mark.skipif(kidney_ip.GRB is None,
+		reason = "gurobipy is not installed"))]
+
+def block_instance(blocks = 6, size = 12, p = 0.3, seed = 0):
+	"""An instance made of disjoint random blocks, each with an NDD."""
+	rng = np.random.RandomState(seed)
+	src, tgt, ndd_src, ndd_tgt = [], [], [], []
+	for b in range(blocks):
+		base = b * size
+		adj = rng.rand(size, size) < p
+		np.fill_diagonal(adj, False)
+		s, t = np.nonzero(adj)
+		src += (base + s).tolist()
+		tgt += (base + t).tolist()
+		targets = base + np.flatnonzero(rng.rand(size) < p)
+		ndd_src += [b] * len(targets)
+		ndd_tgt += targets.tolist()
+
+	n = blocks * size
+	digraph = digraph_from_arrays(n, src, tgt, [1.0] * len(src))
+	ndds = ndds_from_arrays(blocks, digraph, ndd_src, ndd_tgt, [1.0] * len(ndd_src))
+	return kidney_ip.OptConfig(digraph, ndds, 3, 3)
+
+def test_components_split_blocks():
+	parts = kidney_components.components(block_instance())
+	assert len(parts) == 6
+	assert all(len(vtx_ids) > 1 and len(ndd_ids) == 1 for vtx_ids, ndd_ids in parts)
+
+def test_parts_solved_at_once():
+	cfg = block_instance()
+	barrier = threading.Barrier(2, timeout = 30)
+	lock = threading.Lock()
+	threads = []
+
+	def solve(part):
+		with lock:
+			threads.append(threading.get_ident())
+			first = len(threads) <= 2
+		# the first two parts only pass the barrier if solved at the same time
+		if first:
+			barrier.wait()
+		return kidney_highs.optimise_picef(part)
+
+	opt = kidney_components.solve_components(cfg, solve, workers = 2)
+	assert len(threads) == 6
+	assert len(set(threads[:2])) == 2
+	assert opt.total_score == kidney_highs.optimise_picef(cfg).total_score
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("seed", range(3))
+def test_workers_match_serial(backend, seed):
+	cfg = block_instance(seed = seed)
+	serial = kidney_solver.solve_kep(cfg, "picef", backend = "highs")
+	parallel = kidney_solver.solve_kep(cfg, "picef", backend = backend,
+		decompose = True, workers = 4)
+	assert parallel.optimal
+	assert parallel.total_score == pytest.approx(serial.total_score)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from gym_kidney import embeddings, pools
+
+def ndd_pool(rng, n = 30, p = 0.15):
+	"""A random pool with edges into and out of its NDDs."""
+	G = pools.Pool()
+	G.add_vertices(n, ndd = rng.rand(n) < 0.3)
+	adj = rng.rand(n, n) < p
+	np.fill_diagonal(adj, False)
+	G.add_edges(*np.nonzero(adj))
+	return G
+
+@pytest.mark.parametrize("seed", range(5))
+def test_incremental_matches_full_with_ndd_in_edges(seed):
+	rng = np.random.RandomState(seed)
+	G = ndd_pool(rng)
+	src, tgt = G.edges()
+	assert G.ndd[tgt].any()
+
+	full = embeddings.CycleCountEmbedding(4)
+	incremental = embeddings.CycleCountEmbedding(4, incremental = True)
+	for tick in range(6):
+		counts = full.embed(G, rng)
+		assert counts.sum() > 0
+		np.testing.assert_array_equal(incremental.embed(G, rng), counts)
+
+		# some vertices leave and others arrive, with edges into NDDs
+		G.remove_vertices(rng.choice(G.n, 3, replace = False))
+		n1 = G.n
+		G.add_vertices(4, ndd = rng.rand(4) < 0.3)
+		new = np.arange(n1, G.n)
+		adj = rng.rand(len(new), G.n) < 0.15
+		s, t = np.nonzero(adj)
+		keep = new[s] != t
+		G.add_edges(new[s][keep], t[keep])
+		G.add_edges(t[keep][::2], new[s][keep][::2])
+
+def test_no_cycles_through_ndds():
+	G = pools.Pool()
+	G.add_vertices(3, ndd = np.array([False, False, True]))
+	# a 2-cycle between the pairs, and a 3-cycle only through the NDD
+	G.add_edges(np.array([0, 1, 1, 2]), np.array([1, 0, 2, 0]))
+
+	rng = np.random.RandomState(0)
+	for incremental in [False, True]:
+		e = embeddings.CycleCountEmbedding(3, incremental = incremental)
+		np.testing.assert_array_equal(e.embed(G, rng), [1, 0])
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from gym_kidney import actions, models, pools
+from gym_kidney._solver import kidney_incremental, kidney_ip, kidney_solver
+
+@pytest.mark.parametrize("caps", [(3, 0), (3, 3)])
+@pytest.mark.parametrize("seed", range(3))
+def test_incremental_matches_full_solve(seed, caps):
+	rng = np.random.RandomState(seed)
+	model = models.HomogeneousModel(200, 10, 0.05, 0.1, 100)
+	flap = actions.FlapAction(caps[0], caps[1], backend = "highs")
+	engine = kidney_incremental.IncrementalPicef(caps[0], caps[1],
+		backend = "highs")
+	G = pools.Pool()
+	scores = []
+
+	for tick in range(25):
+		G, __ = model.evolve(G, rng, tick)
+		if tick % 4 == 3:
+			# reweight some of the edges
+			src, tgt = G.edges()
+			some = rng.rand(len(src)) < 0.2
+			G.set_weights(src[some], tgt[some], rng.rand(some.sum()) + 0.5)
+
+		src, tgt = G.edges()
+		cycles, chains = engine.solve(G.uid, G.ndd, src, tgt,
+			G.weights(src, tgt))
+
+		dd, ndds = flap._pool_to_ks(G)
+		cfg = kidney_ip.OptConfig(dd, ndds, caps[0], caps[1])
+		full = kidney_solver.solve_kep(cfg, "picef", backend = "highs")
+		assert engine.optimal
+		assert engine.score == pytest.approx(full.total_score)
+		scores.append(full.total_score)
+
+		matched = np.concatenate([np.arange(0)] + cycles +
+			[np.append(ndd, vs) for ndd, vs in chains]).astype(int)
+		assert len(np.unique(matched)) == len(matched)
+		if tick % 2 == 1:
+			G.remove_vertices(matched)
+
+	assert sum(scores) > 0
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from gym_kidney._solver import kidney_reduce, kidney_solver
+from instances import random_instance
+
+@pytest.mark.parametrize("caps", [(2, 0), (3, 2), (4, 3)])
+@pytest.mark.parametrize("seed", range(8))
+def test_reduced_matches_unreduced(seed, caps):
+	cfg = random_instance(30, 3, 0.08, seed, weighted = True,
+		max_cycle = caps[0], max_chain = caps[1])
+	full = kidney_solver.solve_kep(cfg, "picef", backend = "highs")
+	reduced = kidney_solver.solve_kep(cfg, "picef", backend = "highs",
+		reduce = True)
+	assert reduced.total_score == pytest.approx(full.total_score)
+	assert sum(reduced.reduction_stats.values()) > 0
+
+def test_cycle_edges_on_short_cycles():
+	# a 2-cycle 0 <-> 1, a 3-cycle 2 -> 3 -> 4 -> 2, and an edge 1 -> 2
+	src = np.array([0, 1, 2, 3, 4, 1])
+	tgt = np.array([1, 0, 3, 4, 2, 2])
+	assert kidney_reduce.cycle_edges(5, src, tgt, 2).tolist() == \
+		[True, True, False, False, False, False]
+	assert kidney_reduce.cycle_edges(5, src, tgt, 3).tolist() == \
+		[True, True, True, True, True, False]